@@ -2,6 +2,8 @@
 # for transforming LaTex accents to their UTF8 equivalents
 
 import re
+import bisect
+import functools
 
 class AccentConverter:
 
@@ -11,6 +13,19 @@ class AccentConverter:
         # the translation dictionary, and the set of (regex) detectors for accents
         # each dictionary addition comes with its own (at least 1) detector
 
+        # each detector starts with a backslash (possibly preceded by "{ *"), followed by the accent char,
+        # so a detector can only match strings containing "\" + its accent char
+        self.detector_accent = []
+        for accent_pattern in self.accent_detector:
+            m = re.match( r'(?:\{ \*)?\\\\\\?(.)', accent_pattern.pattern )
+            assert m, accent_pattern.pattern
+            self.detector_accent.append( m.group(1) )
+        # the combined detector, finding all accent chars following a backslash (the lookahead
+        # makes sure that overlapping occurrences like \\" are found as well)
+        self.accent_keys = re.compile( r'\\(?=([%s]))' % re.escape( ''.join( sorted( set( self.detector_accent ) ) ) ) )
+        self.__candidates = {}
+        self.__decode_cached = functools.lru_cache( maxsize = 2 ** 16 )( self.decode_Tex_Accents )
+
     def __create_translation_rules(self):
         """
             creates the rule of translation from latex accent to their equivalent UTF8
@@ -182,24 +197,59 @@ class AccentConverter:
             encode_dict[ accent_pattern_left + charKey + accent_pattern_right ] = (s_value[i], charKey)
 
 
+    def candidate_detectors(self, s):
+        """ returns the sorted list of indices of the detectors which can match @s
+        """
+
+        keys = frozenset( self.accent_keys.findall(s) )
+        if keys not in self.__candidates:
+            self.__candidates[keys] = [i for i, a in enumerate(self.detector_accent) if a in keys]
+        return self.__candidates[keys]
+
+
     def decode_Tex_Accents(self, s, utf8_or_ascii=1):
         """ takes a string input @s, replaces all TeX style accents by their equivalent UTF-8 or ASCII character
             if @utf8_or_ascii==1 replacement is by UTF-8 variant, otherwise plain ASCII will be used
+
+            Only the detectors which can match @s are run - in the same order and with the same result
+            as running all of them.
         """
 
-        for i in range(len(self.accent_detector)):
+        if '\\' not in s:
+            return s
+
+        candidates, j = self.candidate_detectors(s), 0
+        while j < len(candidates):
+            i = candidates[j]
             accent_pattern = self.accent_detector[i] # this is a complied regex corresponding to some accent pattern
 
-            m = set( re.findall(accent_pattern, s) ) # we might have the same substring appearing several times.
-                                                     # Since the replacement depends only on the translation rule, we pass from
-                                                     # list to set in order to (potentially) decrease the number of string opertions
+            m = set( accent_pattern.findall(s) ) # we might have the same substring appearing several times.
+                                                 # Since the replacement depends only on the translation rule, we pass from
+                                                 # list to set in order to (potentially) decrease the number of string opertions
+            s0 = s
             for s1 in m:
                 x = s1.replace(' ','') # remove the spaces to match the format of translation table
-                if x in self.translation_rule.keys():
+                if x in self.translation_rule:
                     if utf8_or_ascii == 1:
                         s = s.replace( s1, self.translation_rule[x][0] )
                     else:
                         s = s.replace( s1, self.translation_rule[x][1] )
 
+            if s != s0:
+                # replacements may have removed or added backslash + accent char sequences
+                candidates = self.candidate_detectors(s)
+                j = bisect.bisect_right(candidates, i)
+            else:
+                j += 1
 
         return s
+
+
+    def decode_Tex_Accents_cached(self, s, utf8_or_ascii=1):
+        """ like decode_Tex_Accents, but memoizing the results for short strings - i.e. words -
+            which are typically converted many times
+        """
+
+        if len(s) > 64 or '\\' not in s:
+            return self.decode_Tex_Accents(s, utf8_or_ascii)
+        return self.__decode_cached(s, utf8_or_ascii)
@@ -1,38 +1,75 @@
 import json
 import glob
-import requests
 import re
-import sys
 import os
+import argparse
+import collections
+import unicodedata
 
 from misextractions import misextractions
+from jsonstream import iter_objects
+from nerclient import NERClient, NER_URL, pack, unpack
+from gazetteer import Gazetteer
 
 NUMPATTERN = re.compile("[A-Za-z][-0-9]+")  # stuff like M2-34 is not any good
+TEXCOMMAND = re.compile(r"\\[a-zA-Z]+|\$[^$]*\$")
+WORD = re.compile(r"[^\W\d_]{2,}(?:['’-][^\W\d_]+)*")
+MARKUP = "[]{}<>|=_^\\"
+TEXBRACES = re.compile(r"(?<!\\)[{}]")
+TEXSPACE = re.compile(r"\\\\|~")
+# Thresholds for the pre-filter, chosen on nercache.json: translations with fewer content words, or
+# more markup, practically never yield entities.
+MIN_CONTENT_WORDS = 3
+MAX_MARKUP_DENSITY = 0.2
+# Surface forms which the online resolver links in less than this share of the cached translations
+# containing them - like "is", "have" or "yesterday" - are left out of the gazetteer.
+MIN_LINK_PROBABILITY = 0.5
+
+stats = collections.Counter()
+
+
+def canonical(text):
+    """
+    the form of a translation which is sent to the online resolver, and used as key in the cache:
+    NFC normalized, without TeX braces, with whitespace collapsed
+    """
+    text = TEXBRACES.sub("", unicodedata.normalize("NFC", text))
+    return " ".join(TEXSPACE.sub(" ", text).split())
+
+
+def fold(cache):
+    """
+    key the entries of a cache by the canonical form of the translations
+
+    :return: pair `(cache, merged)`, with `merged` mapping canonical forms to the keys of the
+    entries merged into one
+    """
+    folded, merged = {}, collections.defaultdict(list)
+    for text in sorted(cache):
+        key = canonical(text)
+        merged[key].append(text)
+        folded.setdefault(key, {}).update(cache[text])
+    return folded, {k: v for k, v in merged.items() if len(v) > 1}
 
-offset = 0
-try:
-    offset = int(sys.argv[1])
-except IndexError:
-    pass
 
 try:
-    nercache = json.loads(open("nercache.json").read())
+    nercache, _ = fold(json.loads(open("nercache.json").read()))
 except FileNotFoundError:
     nercache = {}
 
+# entities of translations tagged with the gazetteer - which are not cached
+tagged = {}
 
-def get_entities(text):
-    global nercache
-    """send text to online resolver and retrieve wikidataId's"""
-    ner_url = "https://cloud.science-miner.com/nerd/service/disambiguate"
-    if len(text.split()) < 5:  # cannot do NER on less than 5 words
-        return {}
-    rtext = requests.post(ner_url, json={"text": text}).text
-    # parse json
+
+def retrieved_entities(rtext):
+    """parse the response of the online resolver"""
     if rtext == None:
-        return {}
-    retrieved_entities = json.loads(rtext).get("entities", [])
-    # extract names and wikidataId's
+        return []
+    return json.loads(rtext).get("entities", [])
+
+
+def parse_entities(retrieved_entities):
+    """extract names and wikidataId's"""
     return {
         x["wikidataId"]: x["rawName"]
         for x in retrieved_entities
@@ -42,27 +79,238 @@ def get_entities(text):
     }
 
 
-for f in glob.glob("langscijson/*json")[offset:]:
-    print(f)
-    with open(f) as jsoncontent:
-        writedict = {}
-        file_examples = json.loads(jsoncontent.read())
-        for ex in file_examples:
-            ID = ex["ID"]
-            trs = ex["trs"]
-            try:
-                entities = nercache[trs]
-            except KeyError:
-                entities = get_entities(trs)
-                nercache[trs] = entities
-            writedict[ID] = {"entities": entities, "trs": trs}
+def content_words(text):
+    """words which may be (part of) an entity name, i.e. no TeX, numbers or gloss abbreviations"""
+    res = []
+    for token in TEXCOMMAND.sub(" ", text).split():
+        m = WORD.search(token)
+        if not m or NUMPATTERN.match(token):
+            continue
+        if m.group().isupper() and len(m.group()) <= 4:  # gloss abbreviations, tree labels
+            continue
+        res.append(m.group())
+    return res
+
+
+def hopeless(text):
+    """cheap guess whether the online resolver will not find any entities in a text"""
+    if len(content_words(text)) < MIN_CONTENT_WORDS:
+        return True
+    markup = sum(text.count(c) for c in MARKUP) + 3 * len(TEXCOMMAND.findall(text))
+    return markup / len(text) > MAX_MARKUP_DENSITY
+
+
+def build_gazetteer():
+    """
+    compile the surface forms of the entities in the cache - and the titles of the entities in
+    entitiestitles.json - into a gazetteer, leaving out forms with a low link probability
+    """
+    forms = [(name, wdid) for entities in nercache.values() for wdid, name in entities.items()]
     try:
-        os.mkdir('entitiesjson')
-    except FileExistsError:
-        pass
-    entitiesfile = f.replace("langscijson", "entitiesjson")
-    with open(entitiesfile, "w") as entitiesjson:
-        entitiesjson.write(json.dumps(writedict, indent=4, sort_keys=True))
-
-    with open("nercache.json", "w") as nercachejson:
-        nercachejson.write(json.dumps(nercache, indent=4, sort_keys=True))
+        titles = json.loads(open("entitiestitles.json").read())
+    except FileNotFoundError:
+        titles = {}
+    forms.extend(
+        (title.replace("_", " "), wdid) for wdid, title in titles.items()
+        if title and title != "no title")
+    gazetteer = Gazetteer(
+        (name, wdid) for name, wdid in forms
+        if wdid not in misextractions and not NUMPATTERN.match(name))
+    occurrences, links = collections.Counter(), collections.Counter()
+    for text, entities in nercache.items():
+        for form in gazetteer.tag(text).values():
+            occurrences[form] += 1
+            if form in entities.values():
+                links[form] += 1
+    return Gazetteer(
+        (form, wdid) for form, wdid in gazetteer.forms.items()
+        if not occurrences[form] or links[form] / occurrences[form] >= MIN_LINK_PROBABILITY)
+
+
+def get_entities(texts, client, packsize=0, prefilter=False, gazetteer=None, offline=False):
+    """
+    send texts not yet in the cache to the online resolver, and add the results to the cache
+
+    with a `packsize`, texts are packed into documents of up to `packsize` characters, to be
+    resolved with one request each
+    with `prefilter`, texts which are `hopeless` are added to the cache as having no entities
+    with a `gazetteer`, texts containing known surface forms are tagged offline - with `offline`,
+    all texts are
+    """
+    global nercache
+    todo = []
+    for text in texts:
+        text = canonical(text)
+        stats["translations"] += 1
+        if text in nercache:
+            stats["cached"] += 1
+            continue
+        if len(text.split()) < 5:  # cannot do NER on less than 5 words
+            stats["too short"] += 1
+            nercache[text] = {}
+        elif prefilter and hopeless(text):
+            stats["pre-filtered"] += 1
+            nercache[text] = {}
+        elif gazetteer is not None and (offline or gazetteer.tag(text)):
+            stats["tagged offline"] += 1
+            tagged[text] = gazetteer.tag(text)
+        else:
+            todo.append(text)
+    todo = list(dict.fromkeys(todo))
+    stats["resolved"] += len(todo)
+    if not packsize:
+        for text, rtext in zip(todo, client(todo)):
+            nercache[text] = parse_entities(retrieved_entities(rtext))
+        return
+    documents = pack(todo, packsize)
+    texts = iter(todo)
+    for (document, offsets), rtext in zip(documents, client([d for d, _ in documents])):
+        packed = [next(texts) for _ in offsets]
+        for text, entities in zip(
+                packed, unpack(retrieved_entities(rtext), offsets, [len(t) for t in packed])):
+            nercache[text] = parse_entities(entities)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Retrieve the Wikidata entities mentioned in the translations of the examples.")
+    parser.add_argument(
+        "offset",
+        nargs="?",
+        type=int,
+        default=0,
+        help="Number of files in langscijson/ to skip",
+    )
+    parser.add_argument("--ner-url", default=NER_URL, help="URL of the disambiguate endpoint")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximal number of concurrent requests",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Maximal number of requests per second",
+    )
+    parser.add_argument(
+        "--pack",
+        type=int,
+        default=0,
+        metavar="SIZE",
+        help="Pack translations into documents of up to SIZE characters, resolved with one request "
+             "each",
+    )
+    parser.add_argument(
+        "--prefilter",
+        action="store_true",
+        default=False,
+        help="Do not send translations which are unlikely to yield entities",
+    )
+    parser.add_argument(
+        "--prefilter-report",
+        action="store_true",
+        default=False,
+        help="Report how the pre-filter performs on the translations in nercache.json, and exit",
+    )
+    parser.add_argument(
+        "--gazetteer",
+        action="store_true",
+        default=False,
+        help="Tag translations containing surface forms of known entities offline, i.e. with a "
+             "gazetteer compiled from nercache.json and entitiestitles.json",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        default=False,
+        help="Tag all translations not in nercache.json with the gazetteer",
+    )
+    parser.add_argument(
+        "--migrate-cache",
+        action="store_true",
+        default=False,
+        help="Key the entries in nercache.json by canonical form, report merged entries, and exit",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="Number of retries of a failed request",
+    )
+    args = parser.parse_args()
+
+    if args.migrate_cache:
+        raw = json.loads(open("nercache.json").read())
+        nercache, merged = fold(raw)
+        for key, texts in sorted(merged.items()):
+            conflict = len({json.dumps(raw[t], sort_keys=True) for t in texts}) > 1
+            print(f"{key!r}{' (entities merged)' if conflict else ''}:")
+            for text in texts:
+                print(f"    {text!r}")
+        with open("nercache.json", "w") as nercachejson:
+            nercachejson.write(json.dumps(nercache, indent=4, sort_keys=True))
+        print(f"{len(raw)} entries folded into {len(nercache)}: "
+              f"{sum(len(t) - 1 for t in merged.values())} duplicates in {len(merged)} groups")
+        raise SystemExit
+
+    if args.prefilter_report:
+        candidates = {k: v for k, v in nercache.items() if len(k.split()) >= 5}
+        filtered = [k for k in candidates if hopeless(k)]
+        lost = [k for k in filtered if candidates[k]]
+        print(f"{len(candidates)} cached translations with at least 5 words, "
+              f"{sum(1 for v in candidates.values() if v)} with entities")
+        print(f"pre-filter saves {len(filtered)} calls ({len(filtered) / len(candidates):.1%}), "
+              f"losing the entities of {len(lost)} translations:")
+        for k in lost:
+            print(f"    {k.strip()!r}: {', '.join(candidates[k].values())}")
+        raise SystemExit
+
+    gazetteer = None
+    if args.gazetteer or args.offline:
+        gazetteer = build_gazetteer()
+        print(f"gazetteer with {len(gazetteer)} surface forms")
+
+    # The output of extractgll.py, in any of its formats:
+    files = [
+        f for f in glob.glob("langscijson/*") if f.endswith((".json", ".jsonl", ".jsonl.gz"))]
+
+    with NERClient(
+            args.ner_url,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            retries=args.retries) as client:
+        for f in files[args.offset:]:
+            print(f)
+            examples = [(ex["ID"], ex["trs"]) for ex in iter_objects(f, ["ID", "trs"])]
+            get_entities(
+                [trs for _, trs in examples],
+                client,
+                packsize=args.pack,
+                prefilter=args.prefilter,
+                gazetteer=gazetteer,
+                offline=args.offline)
+            writedict = {}
+            for ID, trs in examples:
+                key = canonical(trs)
+                entities = nercache[key] if key in nercache else tagged[key]
+                writedict[ID] = {"entities": entities, "trs": trs}
+            try:
+                os.mkdir('entitiesjson')
+            except FileExistsError:
+                pass
+            entitiesfile = re.sub(
+                r"\.jsonl(\.gz)?$", ".json", f.replace("langscijson", "entitiesjson"))
+            with open(entitiesfile, "w") as entitiesjson:
+                entitiesjson.write(json.dumps(writedict, indent=4, sort_keys=True))
+
+            with open("nercache.json", "w") as nercachejson:
+                nercachejson.write(json.dumps(nercache, indent=4, sort_keys=True))
+
+    print(f"{stats['translations']} translations: {stats['cached']} cached, "
+          f"{stats['too short']} too short, {stats['pre-filtered']} pre-filtered, "
+          f"{stats['tagged offline']} tagged offline, "
+          f"{stats['resolved']} resolved with {client.requests} requests")
+    if args.prefilter:
+        print(f"pre-filter saved {stats['pre-filtered']} calls")
@@ -1,17 +1,32 @@
+import os
 import re
+import json
 import math
+import hashlib
 import pathlib
+import time
+import functools
 import collections
+import multiprocessing
 import urllib.request
 
+import pyigt
+import pycldf
+import clldutils
 from tqdm import tqdm
 from pyigt import IGT
 from pyigt.igt import NON_OVERT_ELEMENT, LGRConformance
 from pyigt.lgrmorphemes import MORPHEME_SEPARATORS
 from clldutils.lgr import ABBRS as lgrabbrs
-from clldutils.jsonlib import load
 from cldfbench import Dataset as BaseDataset
 from bs4 import BeautifulSoup as bs
+from simplepybtex import database
+
+from trieregex import trie_regex
+from jsonstream import iter_objects
+from columnstore import StoredFile, open_store
+from imtvaultcache import file_digest, Manifest, PickleCache, GlottologSnapshot, IGTCache
+from imtvaultprofile import Profile, NullProfile
 
 ABBRS = list(lgrabbrs.keys())
 ABBRS.extend([
@@ -23,6 +38,18 @@ ABBRS.extend([
     'DIM',
     'PRAG',
     'R', 'RETRO', 'LINK', 'IFV', 'DEP', 'EXT', 'ID', 'CONTR', 'IO', 'DO', 'TNS'])
+# The fields of the objects in extracted_examples/*.json which are used to create the CLDF data.
+EXAMPLE_FIELDS = [
+    'ID',
+    'book_ID',
+    'book_metalanguage',
+    'language_glottocode',
+    'language_name',
+    'srcwordsbare',
+    'imtwordsbare',
+    'trs',
+    'abbrkey',
+]
 META_LANGS = {
     'eng',
     'fra',
@@ -33,65 +60,74 @@ META_LANGS = {
 }
 
 
+class GlossNormalizer:
+    """
+    Normalizes TeX markup in word tokens of primary text and gloss lines.
+
+    All regular expressions are compiled once; the alternations over the (lowercased, capitalized)
+    abbreviations are compiled into tries. Since the same tokens - `3SG`, `PST`, `{\\sc erg}`, ... -
+    occur over and over again in the corpus, normalized tokens are memoized in a bounded LRU cache.
+    Hit and miss counts are available via `cache_info()`.
+    """
+    def __init__(self, abbrs, maxsize=2 ** 16):
+        assert all(a == a.upper() for a in abbrs)
+        # {\ABBR}, {\abbr} and {\Abbr}
+        self.braced_abbr = re.compile(r'{\\(%s)}' % trie_regex(
+            set(abbrs) | {a.lower() for a in abbrs} | {a.capitalize() for a in abbrs}))
+        # \abbr{}
+        self.lower_abbr = re.compile(r'\\(%s){}' % trie_regex(a.lower() for a in abbrs))
+        self.braced_upper = re.compile(r'{([A-Z]+)}')
+        self.gloss = re.compile(r'\\gloss{([a-z0-9.:-]+)}')
+        self.gloss_upper = re.compile(r'\\gloss([A-Z]+){}')
+        self.hspace = re.compile(r'\\hspace{[^}]+}')
+        self.emph = re.compile(r'\\(emph|stem|bf){([^}]+)}')
+        self.mc = re.compile(r'\\(mc){([^}]+)}')
+        self.gsc = re.compile(r'\\gsc([A-Z]+)')
+        self._normalize = functools.lru_cache(maxsize=maxsize)(self.normalize)
+
+    def __call__(self, tex, count=None):
+        tex = self._normalize(tex)
+        if count is not None and '\\' in tex:
+            count.update([tex])
+        return tex
+
+    def cache_info(self):
+        return self._normalize.cache_info()
+
+    def normalize(self, tex):
+        tex = self.braced_abbr.sub(lambda m: m.groups()[0].upper(), tex)
+        tex = self.lower_abbr.sub(lambda m: m.groups()[0].upper(), tex)
+        tex = self.braced_upper.sub(lambda m: m.groups()[0], tex)
+        #\gloss{cl.3sg}
+        tex = self.gloss.sub(lambda m: m.groups()[0].upper(), tex)
+        tex = self.gloss_upper.sub(lambda m: m.groups()[0], tex)
+        tex = tex.replace('$\\emptyset$', NON_OVERT_ELEMENT)
+        tex = self.hspace.sub('', tex)
+        tex = self.emph.sub(lambda m: m.groups()[1], tex)
+        tex = self.mc.sub(lambda m: m.groups()[1].upper(), tex)
+        tex = tex.replace(r'\(ø\)', NON_OVERT_ELEMENT)
+        tex = self.gsc.sub(lambda m: m.groups()[0], tex)
+        tex = tex.replace(r'\redp{}', '~')
+        tex = tex.replace('${\\Rightarrow}$', '→')
+        tex = tex.replace(r'{\USSmaller}', '<')
+        tex = tex.replace(r'{\USGreater}', '>')
+        tex = tex.replace(r'\Third{}', '3')
+        tex = tex.replace(r'\Tsg{}', '3SG')
+        tex = tex.replace(r'\Tpl{}', '3PL')
+        tex = tex.replace(r'\Third.', '3.')
+        tex = tex.replace(r'\Third>', '3>')
+        tex = tex.replace(r'\Tsg.', '3SG.')
+        tex = tex.replace(r'\squish', '')
+        tex = tex.replace('__tld{}', '~')
+        #\\op...\\cp{} -> (…)
+        return tex
+
+
+normalize = GlossNormalizer(ABBRS)
+
+
 def clean(tex, count):
-    tex = re.sub(  # {\ABBR}
-        r'{\\(%s)}' % '|'.join(re.escape(a) for a in ABBRS),
-        lambda m: m.groups()[0],
-        tex
-    )
-    tex = re.sub(  # {\abbr}
-        r'{\\(%s)}' % '|'.join(re.escape(a.lower()) for a in ABBRS),
-        lambda m: m.groups()[0].upper(),
-        tex
-    )
-    tex = re.sub(  # \abbr{}
-        r'\\(%s){}' % '|'.join(re.escape(a.lower()) for a in ABBRS),
-        lambda m: m.groups()[0].upper(),
-        tex
-    )
-    tex = re.sub(  # {\Abbr}
-        r'{\\(%s)}' % '|'.join(re.escape(a.capitalize()) for a in ABBRS),
-        lambda m: m.groups()[0].upper(),
-        tex
-    )
-    tex = re.sub(  # {ABBR}
-        r'{([A-Z]+)}',
-        lambda m: m.groups()[0],
-        tex
-    )
-    #\gloss{cl.3sg}
-    tex = re.sub(
-        r'\\gloss{([a-z0-9.:-]+)}',
-        lambda m: m.groups()[0].upper(),
-        tex
-    )
-    tex = re.sub(
-        r'\\gloss([A-Z]+){}',
-        lambda m: m.groups()[0],
-        tex
-    )
-    tex = tex.replace('$\\emptyset$', NON_OVERT_ELEMENT)
-    tex = re.sub(r'\\hspace{[^}]+}', '', tex)
-    tex = re.sub(r'\\(emph|stem|bf){([^}]+)}', lambda m: m.groups()[1], tex)
-    tex = re.sub(r'\\(mc){([^}]+)}', lambda m: m.groups()[1].upper(), tex)
-    tex = tex.replace(r'\(ø\)', NON_OVERT_ELEMENT)
-    tex = re.sub(r'\\gsc([A-Z]+)', lambda m: m.groups()[0], tex)
-    tex = tex.replace(r'\redp{}', '~')
-    tex = tex.replace('${\\Rightarrow}$', '→')
-    tex = tex.replace(r'{\USSmaller}', '<')
-    tex = tex.replace(r'{\USGreater}', '>')
-    tex = tex.replace(r'\Third{}', '3')
-    tex = tex.replace(r'\Tsg{}', '3SG')
-    tex = tex.replace(r'\Tpl{}', '3PL')
-    tex = tex.replace(r'\Third.', '3.')
-    tex = tex.replace(r'\Third>', '3>')
-    tex = tex.replace(r'\Tsg.', '3SG.')
-    tex = tex.replace(r'\squish', '')
-    tex = tex.replace('__tld{}', '~')
-    #\\op...\\cp{} -> (…)
-    if '\\' in tex:
-        count.update([tex])
-    return tex
+    return normalize(tex, count)
 
 
 def recombine(l):
@@ -108,6 +144,7 @@ def recombine(l):
     if chunk:
         yield ''.join(chunk)
 
+@functools.lru_cache(maxsize=2 ** 14)
 def clean_abbr(k):
     # 1, 2, 3
     # 1/2/3
@@ -125,13 +162,309 @@ def clean_abbr(k):
         return k
 
 
+def filtered(l, c):
+    return list(recombine([normalize(k.replace('\\t', '__t'), c) for k in l if k not in ['{}', '', '--']]))
+
+
+def fix_bibtex(s):
+    res, doi = [], False
+    for line in s.split('\n'):
+        if line.strip().startswith('doi'):
+            if doi:
+                continue
+            else:
+                doi = True
+        if 'author' in line:
+            line = line.replace('and ', ' and ')
+        res.append(line)
+    return '\n'.join(res)
+
+
+def parse_bibtex(p):
+    return database.parse_string(fix_bibtex(p.read_text(encoding='utf8')), bib_format='bibtex')
+
+
+def iter_sources(paths, workers=1, cache=None):
+    """
+    Yield the parsed BibTeX of the files in `paths` - as `BibliographyData`, i.e. as what
+    `Sources.add` creates from BibTeX strings - in the order of `paths`.
+
+    If a `PickleCache` is passed, only new or changed files are parsed - in a process pool, if
+    `workers > 1`.
+    """
+    digests = {p: file_digest(p) for p in paths} if cache else {}
+    todo = [p for p in paths if not (cache and digests[p] in cache)]
+
+    def results(pool=None):
+        res = pool.imap(parse_bibtex, todo) if pool else map(parse_bibtex, todo)
+        for p in paths:
+            bib = cache.get(digests[p]) if cache else None
+            if bib is None:
+                bib = next(res)
+                if cache:
+                    cache.set(digests[p], bib)
+            yield bib
+
+    if workers > 1 and len(todo) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            yield from results(pool)
+    else:
+        yield from results()
+
+
+def get_abbrs(d):
+    res = {}
+    for k, v in (d or {}).items():
+        k = clean_abbr(k)
+        if k:
+            res[k] = v
+    return res
+
+
+# Part of the keys in the IGT cache: Bump this when `analyze_igt` - or how `make_examples` uses its
+# results - changes, to invalidate cached results.
+IGT_CACHE_VERSION = 1
+
+
+def analyze_igt(phrase, gloss, abbrs):
+    igt = IGT(phrase=phrase, gloss=gloss, abbrs=abbrs)
+    conformance = igt.conformance
+    return dict(
+        primary_text=igt.primary_text,
+        conformance=conformance.name,
+        gloss_abbrs=igt.gloss_abbrs if conformance == LGRConformance.MORPHEME_ALIGNED else {},
+    )
+
+
+_igt_caches = {}
+
+
+def get_igt_cache(p):
+    # SQLite connections must not be shared across processes, so we open one per (worker) process.
+    # The database has already been created by `cmd_makecldf`.
+    key = (os.getpid(), p)
+    if key not in _igt_caches:
+        _igt_caches[key] = IGTCache(p, create=False)
+    return _igt_caches[key]
+
+
+def read_examples(p, keys=None):
+    """
+    :param p: An extracted examples file, either as `pathlib.Path` of the JSON file or as \
+    `StoredFile` in the column store.
+    """
+    return p.iter_objects(keys) if isinstance(p, StoredFile) else iter_objects(p, keys)
+
+
+def make_examples(p, with_source, igt_cache=None, profile=False):
+    """
+    Run the per-file part of `cmd_makecldf`, i.e. everything which does not depend on state shared
+    across files: cleaning, IGT construction and LGR conformance.
+
+    This function is run in worker processes when `IMTVAULT_WORKERS` is set, and its results are
+    cached across runs, so it must only return JSON serializable data.
+
+    If the path of an `IGTCache` is passed as `igt_cache`, IGT analysis is skipped for examples
+    for which the cache has results. Since these results outlive changes of this module, the cache
+    keys include `IGT_CACHE_VERSION`, which must be bumped when `analyze_igt` - or the way its
+    results are used here - changes.
+
+    If `profile` is `True`, the result has an additional key `profile`, holding the serialized
+    `Profile` of the run.
+    """
+    res, tex, books = [], collections.Counter(), {}
+    cache = get_igt_cache(igt_cache) if igt_cache else None
+    prof, normalize_info = Profile() if profile else NullProfile(), normalize.cache_info()
+    for ex in prof.iter('json', read_examples(p, EXAMPLE_FIELDS)):
+        try:
+            books[str(ex['book_ID'])] = str(ex['book_ID']) in with_source
+            if str(ex['book_ID']) not in with_source:
+                continue  # Either an unpublished or a superseded book.
+        except:
+            print(p)
+            print(ex)
+            raise
+
+        with prof['clean'] as stage:
+            obj = filtered(ex['srcwordsbare'], tex)
+            gloss = filtered(ex['imtwordsbare'], tex)
+            stage.items += len(ex['srcwordsbare']) + len(ex['imtwordsbare'])
+        if not (obj and gloss):
+            assert obj == gloss == []
+            continue  # No primary text or gloss.
+        assert all(s for s in obj) and all(s for s in gloss)
+
+        with prof['igt'] as stage:
+            kw = dict(phrase=' '.join(obj), gloss=' '.join(gloss), abbrs=get_abbrs(ex['abbrkey']))
+            igt = None
+            if cache:
+                key = cache.key(IGT_CACHE_VERSION, pyigt.__version__, kw)
+                igt = cache.get(key)
+            if igt is None:
+                igt = analyze_igt(**kw)
+                prof.counts['igt analyzed'] += 1
+                if cache:
+                    cache.set(key, igt)
+            stage.items += 1
+        res.append(dict(
+            book_ID=ex['book_ID'],
+            ID=ex['ID'],
+            language_glottocode=ex.get('language_glottocode') or 'und',
+            language_name=ex.get('language_name'),
+            book_metalanguage=ex['book_metalanguage'],
+            trs=ex['trs'],
+            obj=obj,
+            gloss=gloss,
+            **igt
+        ))
+    if cache:
+        with prof['igt cache flush']:
+            cache.flush()
+    # `books` records for which books examples have been skipped, because cached results are only
+    # valid as long as the set of books with sources doesn't change for these.
+    res = dict(examples=res, tex=tex, books=books)
+    if profile:
+        info = normalize.cache_info()
+        prof.counts.update({
+            'normalize cache hits': info.hits - normalize_info.hits,
+            'normalize cache misses': info.misses - normalize_info.misses,
+        })
+        res['profile'] = prof.as_dict()
+    return res
+
+
+def pipeline_version():
+    """
+    Cached results of `make_examples` become invalid when the code creating them - including the
+    helper modules used for reading and normalizing the examples - changes.
+    """
+    here = pathlib.Path(__file__).parent
+    return hashlib.sha256(''.join([
+        (here / name).read_text(encoding='utf8') for name in [
+            "cldfbench_imtvault.py",
+            "trieregex.py",
+            "jsonstream.py",
+            "columnstore.py",
+        ]] + [
+        pyigt.__version__,
+        clldutils.__version__,
+    ]).encode('utf8')).hexdigest()
+
+
+def iter_examples(paths, with_source, workers=1, manifest=None, igt_cache=None, profile=None):
+    """
+    Yield the results of `make_examples` for `paths`, in the order of `paths`.
+
+    With `workers > 1`, files are processed in a process pool; since results are still consumed in
+    input order, the merge in `cmd_makecldf` is the same as for a serial run.
+
+    If a `Manifest` is passed, only new or changed files are processed, and results for unchanged
+    files are read from the cache.
+
+    If a `Profile` is passed, the profiles of the `make_examples` runs are merged into it.
+    """
+    func = functools.partial(
+        make_examples, with_source=with_source, igt_cache=igt_cache, profile=bool(profile))
+    digests, todo = {}, []
+    for p in paths:
+        if manifest:
+            digests[p] = p.digest if isinstance(p, StoredFile) else file_digest(p)
+            if manifest.is_current(p.name, digests[p]):
+                continue
+        todo.append(p)
+    pending = set(todo)
+
+    def results(pool=None):
+        # Results for the files to be processed, in order.
+        res = pool.imap(func, todo, chunksize=4) if pool else map(func, todo)
+        for p in paths:
+            data = None
+            if p not in pending:
+                data = manifest.get(p.name, digests[p], valid=lambda d: all(
+                    (b in with_source) == included for b, included in d['books'].items()))
+            if data is None:
+                data = next(res) if p in pending else func(p)
+                if 'profile' in data:
+                    profile.update(data.pop('profile'))
+                if manifest:
+                    manifest.set(p.name, digests[p], data)
+            yield data
+
+    if workers > 1 and todo:
+        with multiprocessing.Pool(workers) as pool:
+            yield from results(pool)
+    else:
+        yield from results()
+
+
 class Dataset(BaseDataset):
     dir = pathlib.Path(__file__).parent
     id = "imtvault"
 
+    @property
+    def cache_dir(self):
+        return self.dir / '.cache'
+
+    @property
+    def example_store_path(self):
+        return self.dir / 'extracted_examples.columns'
+
+    @property
+    def profile_path(self):
+        return self.dir / 'makecldf-profile.json'
+
     def cldf_specs(self):  # A dataset must declare all CLDF sets it creates.
         return super().cldf_specs()
 
+    def _cmd_makecldf(self, args):
+        """
+        With `IMTVAULT_PROFILE` set, time the stages of the build and write a report to
+        `profile_path`.
+        With `IMTVAULT_PROFILE=cprofile`, the main loop of `cmd_makecldf` is also run under
+        cProfile.
+        """
+        mode = os.environ.get('IMTVAULT_PROFILE')
+        if not mode:
+            return super()._cmd_makecldf(args)
+        args.profile = Profile(cprofile=mode == 'cprofile')
+        start = time.perf_counter()
+        super()._cmd_makecldf(args)
+        report = args.profile.report(
+            total=time.perf_counter() - start,
+            workers=int(os.environ.get('IMTVAULT_WORKERS', 1)) or os.cpu_count(),
+            cache=os.environ.get('IMTVAULT_CACHE', '1') != '0',
+        )
+        self.profile_path.write_text(json.dumps(report, indent=2), encoding='utf8')
+        args.log.info('Profile written to {}'.format(self.profile_path))
+        if args.profile.cprofile:
+            args.profile.cprofile.dump_stats(str(self.profile_path.with_suffix('.prof')))
+
+    def example_files(self, log=None):
+        """
+        The extracted examples files, sorted by name.
+
+        If the column store written by `cldfbench imtvault.makestore` exists, files are read from
+        the store - unless the JSON file in `extracted_examples/` has changed since the store was
+        written. If `extracted_examples/` contains no JSON files, all files in the store are used.
+
+        :return: `list` of `pathlib.Path` or `StoredFile` objects.
+        """
+        paths = sorted(self.dir.joinpath('extracted_examples').glob('*.json'))
+        if not self.example_store_path.exists():
+            return paths
+        stored = {f.name: f for f in open_store(self.example_store_path)}
+        if not paths:
+            return [stored[name] for name in sorted(stored)]
+        res = [
+            stored[p.name] if p.name in stored and stored[p.name].digest == file_digest(p) else p
+            for p in paths]
+        changed = [p.name for p in res if not isinstance(p, StoredFile)]
+        if changed and log:
+            log.warning(
+                '{} files not in {} or changed - re-run `cldfbench imtvault.makestore`'.format(
+                    len(changed), self.example_store_path.name))
+        return res
+
     def cmd_download(self, args):
         def get_bibtex(book_id):
             res = urllib.request.urlopen('https://langsci-press.org/catalog/book/{}'.format(book_id))
@@ -144,7 +477,7 @@ class Dataset(BaseDataset):
         missing = set()
         abbrs = collections.Counter()
         for p in tqdm(list(self.dir.joinpath('extracted_examples').glob('*.json'))):
-            for ex in load(p):
+            for ex in iter_objects(p, ['book_ID', 'abbrkey']):
                 #abbrs.update([clean_abbr(k) for k in (ex['abbrkey'] or {}).keys() if not re.fullmatch('[0-9A-Z]+', clean_abbr(k))])
                 #continue
                 op = self.etc_dir / 'bibtex' / '{}.bib'.format(ex['book_ID'])
@@ -158,6 +491,10 @@ class Dataset(BaseDataset):
             print(k, v)
 
     def cmd_makecldf(self, args):
+        profile = getattr(args, 'profile', None) or NullProfile()
+        if profile:
+            # The CLDF data is written by the writer, after `cmd_makecldf` returns.
+            args.writer.write = profile.timed('write', args.writer.write)
         args.writer.cldf.add_component(
             'LanguageTable',
             {
@@ -188,62 +525,52 @@ class Dataset(BaseDataset):
             },
         )
 
-        def filtered(l, c):
-            return list(recombine([clean(k.replace('\\t', '__t'), c) for k in l if k not in ['{}', '', '--']]))
-
-        def fix_bibtex(s):
-            res, doi = [], False
-            for line in s.split('\n'):
-                if line.strip().startswith('doi'):
-                    if doi:
-                        continue
-                    else:
-                        doi = True
-                if 'author' in line:
-                    line = line.replace('and ', ' and ')
-                res.append(line)
-            return '\n'.join(res)
-
-        def get_abbrs(d):
-            res = {}
-            for k, v in (d or {}).items():
-                k = clean_abbr(k)
-                if k:
-                    res[k] = v
-            return res
+        workers = int(os.environ.get('IMTVAULT_WORKERS', 1)) or os.cpu_count()
+        caching = os.environ.get('IMTVAULT_CACHE', '1') != '0'
 
         with_source = set()
-        for p in sorted(self.etc_dir.joinpath('bibtex').glob('*.bib'), key=lambda pp: int(pp.stem)):
+        bibtex = sorted(self.etc_dir.joinpath('bibtex').glob('*.bib'), key=lambda pp: int(pp.stem))
+        sources = PickleCache(
+            self.cache_dir / 'sources.pickle',
+            '{} {}'.format(pipeline_version(), pycldf.__version__)) if caching else None
+        parsed = iter_sources(bibtex, workers=workers, cache=sources)
+        for p, bib in zip(bibtex, profile.iter('bibtex', parsed)):
             with_source.add(p.stem)
-            args.writer.cldf.sources.add(fix_bibtex(p.read_text(encoding='utf8')))
+            with profile['sources']:
+                args.writer.cldf.sources.add(bib)
+        if sources:
+            sources.write()
 
         tex = collections.Counter()
         lgs = collections.Counter()
         mlgs = {}
         seen = set()
-        for p in self.dir.joinpath('extracted_examples').glob('*.json'):
-            fname = re.sub('store-[0-9]+-', '', p.stem) + 'tex'
-            for ex in load(p):
+        # The merge below must see files and examples in a fixed order, to make ID deduplication,
+        # example counts and meta-language resolution independent of the number of workers.
+        paths = self.example_files(args.log)
+        manifest, glottolog, igt_cache, igt_db = None, None, None, None
+        if caching:
+            manifest = Manifest(self.cache_dir / 'examples', pipeline_version())
+            igt_cache = self.cache_dir / 'igt.sqlite'
+            # Create the database before workers open it concurrently.
+            igt_db = IGTCache(igt_cache)
+            glottolog = GlottologSnapshot.from_catalog(self.cache_dir, args.glottolog)
+        with profile['glottolog']:
+            glottolog = glottolog or args.glottolog.api
+        if profile.cprofile:
+            profile.cprofile.enable()
+        for data in profile.iter('examples', iter_examples(
+                paths, with_source,
+                workers=workers, manifest=manifest, igt_cache=igt_cache, profile=profile)):
+            tex.update(data['tex'])
+            for ex in data['examples']:
                 # FIXME:
                 # - abbrkey
                 #
-                try:
-                    if str(ex['book_ID']) not in with_source:
-                        continue  # Either an unpublished or a superseded book.
-                except:
-                    print(p)
-                    print(ex)
-                    raise
-
-                obj = filtered(ex['srcwordsbare'], tex)
-                gloss = filtered(ex['imtwordsbare'], tex)
-                if not (obj and gloss):
-                    assert obj == gloss == []
-                    continue  # No primary text or gloss.
-                assert all(s for s in obj) and all(s for s in gloss)
-
                 if ex['book_metalanguage'] and ex['book_metalanguage'] not in mlgs:
-                    glang = args.glottolog.api.cached_languoids[args.glottolog.api.glottocode_by_iso[ex['book_metalanguage']]]
+                    with profile['glottolog'] as stage:
+                        glang = glottolog.cached_languoids[glottolog.glottocode_by_iso[ex['book_metalanguage']]]
+                        stage.items += 1
                     mlgs[ex['book_metalanguage']] = glang.id
                     args.writer.objects['LanguageTable'].append(dict(
                         ID=glang.id,
@@ -253,13 +580,12 @@ class Dataset(BaseDataset):
                         Longitude=glang.longitude,
                     ))
 
-                if ('language_glottocode' not in ex) or not ex['language_glottocode']:
-                    ex['language_glottocode'] = 'und'
-
                 if ex['language_glottocode'] not in lgs:
                     glang = None
                     if ex['language_glottocode'] != 'und':
-                        glang = args.glottolog.api.cached_languoids[ex['language_glottocode']]
+                        with profile['glottolog'] as stage:
+                            glang = glottolog.cached_languoids[ex['language_glottocode']]
+                            stage.items += 1
                     if not glang or (glang.iso not in mlgs):
                         args.writer.objects['LanguageTable'].append(dict(
                             ID=ex['language_glottocode'],
@@ -272,30 +598,37 @@ class Dataset(BaseDataset):
                         mlgs[glang.iso] = glang.id
 
                 lgs.update([ex['language_glottocode']])
-                tr = ex['trs']
-                igt = IGT(
-                    phrase=' '.join(obj),
-                    gloss=' '.join(gloss),
-                    abbrs=get_abbrs(ex['abbrkey']),
-                )
-                conformance = igt.conformance
+                conformance = LGRConformance[ex['conformance']]
                 ID = '{}-{}'.format(ex['book_ID'], ex['ID']).replace('.', '_')
                 if ID in seen:
-                    #print('+++dup+++', p.name, ID)
+                    #print('+++dup+++', ID)
                     continue
                 seen.add(ID)
                 args.writer.objects['ExampleTable'].append(dict(
                     ID=ID,
                     Language_ID=ex['language_glottocode'],
                     Meta_Language_ID=mlgs.get(ex['book_metalanguage']),
-                    Primary_Text=igt.primary_text,
-                    Analyzed_Word=obj if conformance > LGRConformance.UNALIGNED else [],
-                    Gloss=gloss if conformance > LGRConformance.UNALIGNED else [],
-                    Translated_Text=tr,
+                    Primary_Text=ex['primary_text'],
+                    Analyzed_Word=ex['obj'] if conformance > LGRConformance.UNALIGNED else [],
+                    Gloss=ex['gloss'] if conformance > LGRConformance.UNALIGNED else [],
+                    Translated_Text=ex['trs'],
                     LGR_Conformance_Level=str(conformance),
-                    Abbreviations=igt.gloss_abbrs if conformance == LGRConformance.MORPHEME_ALIGNED else {},
+                    Abbreviations=ex['gloss_abbrs'],
                     Source=['lsp{}'.format(ex['book_ID'])]
                 ))
+        if profile.cprofile:
+            profile.cprofile.disable()
+        if isinstance(glottolog, GlottologSnapshot):
+            glottolog.write()
+            profile.counts['glottolog snapshot misses'] += glottolog.misses
+        if igt_db:
+            igt_db.evict()
+        if manifest:
+            manifest.write(p.name for p in paths)
+            profile.counts.update({
+                'files re-used': manifest.hits, 'files processed': len(paths) - manifest.hits})
+            args.log.info('Re-used cached examples for {} of {} files'.format(
+                manifest.hits, len(paths)))
         for lg in args.writer.objects['LanguageTable']:
             if lg['ID'] != 'und':
                 lg['Examples_Count'] = lgs.get(lg['ID'], 0)
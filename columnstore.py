@@ -0,0 +1,157 @@
+"""
+A compact, columnar store for the records in `extracted_examples/*.json`.
+
+For each JSON file, each field is stored as a separate zlib-compressed JSON chunk, holding the list
+of values of this field for all records of the file. Fields with few distinct values per file - e.g.
+`book_title`, `license` or `abbrkey`, which are the same for all examples of a book - are dictionary
+encoded, i.e. stored as list of distinct values plus list of codes. Records lacking a field are
+listed as `missing`.
+
+So the store does not only take up a fraction of the disk space of the pretty-printed JSON files,
+it also allows reading just the fields needed - without having to decode big, unused values like
+`html`.
+
+The store is a single file, with the chunks followed by an index - a zlib-compressed JSON object -
+and the offset of the index as 8-byte little-endian integer. The index lists the files in the
+store, with the SHA256 digest of the source JSON file, the number of records and offset and length
+of the chunk for each field.
+"""
+import os
+import json
+import zlib
+import struct
+import collections
+
+__all__ = ['write_store', 'ColumnStore', 'StoredFile', 'open_store']
+
+VERSION = 1
+OFFSET = struct.Struct('<Q')
+
+
+class _Missing:
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+
+def encode_column(values):
+    """
+    :param values: `list` of JSON serializable values, with `MISSING` for records lacking the field.
+    :return: `dict` suitable for JSON serialization.
+    """
+    res = {}
+    missing = [i for i, v in enumerate(values) if v is MISSING]
+    if missing:
+        res['missing'] = missing
+        values = [None if v is MISSING else v for v in values]
+    codes, dictionary = {}, []
+    for v in values:
+        key = json.dumps(v, sort_keys=True)
+        if key not in codes:
+            codes[key] = len(dictionary)
+            dictionary.append(v)
+    if len(dictionary) <= len(values) / 2:
+        res['dictionary'] = dictionary
+        res['codes'] = [codes[json.dumps(v, sort_keys=True)] for v in values]
+    else:
+        res['values'] = values
+    return res
+
+
+def decode_column(d):
+    """
+    Note: Values of dictionary encoded columns are shared across records, i.e. they must not be
+    mutated.
+    """
+    if 'dictionary' in d:
+        values = [d['dictionary'][i] for i in d['codes']]
+    else:
+        values = d['values']
+    for i in d.get('missing', []):
+        values[i] = MISSING
+    return values
+
+
+def _compressed(obj):
+    return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf8'))
+
+
+def write_store(path, files):
+    """
+    :param path: Path of the store to write.
+    :param files: Iterable of `(name, digest, records)` triples, where `records` is the list of \
+    objects in a JSON file.
+    """
+    index = dict(version=VERSION, files=collections.OrderedDict())
+    tmp = path.parent / (path.name + '.tmp')
+    with tmp.open('wb') as f:
+        for name, digest, records in files:
+            chunks = collections.OrderedDict()
+            for field in sorted(set(k for r in records for k in r)):
+                chunk = _compressed(encode_column([r.get(field, MISSING) for r in records]))
+                chunks[field] = (f.tell(), len(chunk))
+                f.write(chunk)
+            index['files'][name] = dict(digest=digest, rows=len(records), fields=chunks)
+        offset = f.tell()
+        f.write(_compressed(index))
+        f.write(OFFSET.pack(offset))
+    tmp.replace(path)
+
+
+class ColumnStore:
+    def __init__(self, path):
+        self.path = path
+        self.f = path.open('rb')
+        self.f.seek(-OFFSET.size, os.SEEK_END)
+        end = self.f.tell()
+        offset, = OFFSET.unpack(self.f.read(OFFSET.size))
+        index = self._read(offset, end - offset)
+        if index.get('version') != VERSION:
+            raise ValueError('Unsupported version of column store {}'.format(path))
+        self.files = index['files']
+
+    def _read(self, offset, length):
+        self.f.seek(offset)
+        return json.loads(zlib.decompress(self.f.read(length)).decode('utf8'))
+
+    def __iter__(self):
+        """
+        :return: Generator of `StoredFile` objects for the files in the store.
+        """
+        for name, md in self.files.items():
+            yield StoredFile(self.path, name, md['digest'])
+
+    def iter_objects(self, name, keys=None):
+        """
+        :param name: Name of the JSON file.
+        :param keys: If not `None`, an iterable of keys - only these fields are read.
+        :return: Generator of the records, as `dict`s.
+        """
+        md = self.files[name]
+        keys = set(keys) if keys is not None else None
+        columns = [
+            (field, decode_column(self._read(*chunk)))
+            for field, chunk in md['fields'].items() if keys is None or field in keys]
+        for i in range(md['rows']):
+            yield {field: values[i] for field, values in columns if values[i] is not MISSING}
+
+
+_stores = {}
+
+
+def open_store(path):
+    # Opening the store means reading its index, so we keep one open store per (worker) process.
+    key = (os.getpid(), path)
+    if key not in _stores:
+        _stores[key] = ColumnStore(path)
+    return _stores[key]
+
+
+class StoredFile(collections.namedtuple('StoredFile', 'store name digest')):
+    """
+    Reference to a JSON file in a `ColumnStore`. `StoredFile`s can be passed to worker processes.
+    """
+    def iter_objects(self, keys=None):
+        return open_store(self.store).iter_objects(self.name, keys)
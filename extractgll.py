@@ -6,18 +6,29 @@ import pprint
 import json
 import operator
 import os
+import argparse
+import multiprocessing
 import LaTexAccents
 import requests
 import hashlib
+import pathlib
+import contextlib
 
 from bs4 import BeautifulSoup
 from collections import defaultdict
 from titlemapping import titlemapping
 from lgrlist import LGRLIST
+from texrewriter import Rewriter, ArgumentYanker
+from gllscanner import iter_gll
+from glottologindex import GlottologIndex
+from imtvaultcache import Manifest
+from jsonstream import JSONLinesWriter
 
 from imtvaultconstants import *
 
 converter = LaTexAccents.AccentConverter()
+texreplacer = Rewriter(TEXREPLACEMENTS)
+texargyanker = ArgumentYanker(TEXTARGYANKS)
 
 try:
     glottonames = json.loads(open("glottonames.json").read())
@@ -31,6 +42,15 @@ except FileNotFoundError:
 
 glottotmp = {}
 
+# If set, unknown language names and ISO codes are looked up in this offline index rather than
+# queried from glottolog.org.
+glottolog_index = None
+
+
+def open_glottolog_index(path):
+    global glottolog_index
+    glottolog_index = GlottologIndex(pathlib.Path(path)) if path else None
+
 class gll:
     def __init__(
         self,
@@ -43,7 +63,12 @@ class gll:
         booklanguage=None,
         book_metalanguage="eng",
         abbrkey=None,
+        html=False,
     ):
+        """
+        :param html: Flag signaling whether to render the HTML of the example right away - \
+        otherwise it can be rendered from `srcwordstex` and `imtwordstex` with `render_html`.
+        """
         basename = filename.split("/")[-1]
         self.license = "https://creativecommons.org/licenses/by/4.0"
         self.book_ID = int(filename.split("/")[-2])
@@ -53,19 +78,16 @@ class gll:
         self.abbrkey = abbrkey
         self.categories = self.tex2categories(imt)
         srcwordstex = self.strip_tex_comment(src).split()
-        imtwordstex = [self.resolve_lgr(i) for i in self.strip_tex_comment(imt).split()]
+        imtwordstex = self.strip_tex_comment(imt)
+        if LGRCASCADE.search(imtwordstex):  # see resolve_lgr
+            imtwordstex = [self.resolve_lgr(i) for i in imtwordstex.split()]
+        else:
+            imtwordstex = self.resolve_lgr(imtwordstex).split()
         assert len(srcwordstex) == len(imtwordstex)
-        imt_html = "\n".join(
-            [
-                '\t<div class="imtblock">\n\t\t<div class="srcblock">'
-                + self.tex2html(t[0])
-                + '</div>\n\t\t<div class="glossblock">'
-                + self.tex2html(t[1])
-                + "</div>\n\t</div>"
-                for t in zip(srcwordstex, imtwordstex)
-            ]
-        )
-        self.html = f'<div class="imtblocks">\n{imt_html}\n</div>\n'
+        self.srcwordstex = srcwordstex
+        self.imtwordstex = imtwordstex
+        if html:
+            self.html = render_html(srcwordstex, imtwordstex)
         self.srcwordsbare = [self.striptex(w) for w in srcwordstex]
         self.ID = "%s-%s" % (
             basename.replace(".tex", "").split("/")[-1],
@@ -120,6 +142,24 @@ class gll:
                 except KeyError:
                     if glottotmp.get(lg):
                         self.language_glottocode = None
+                    elif glottolog_index is not None:
+                        # The same decisions as below, based on the languoids with a name containing lg:
+                        languoids = glottolog_index.search(lg)
+                        languoids2 = [l for l in languoids if l.level == "language"]
+                        if len(languoids) == 1:  # exactly one languoid
+                            self.language_glottocode = languoids[0].id
+                            self.language_family = languoids[0].family
+                            self.language_name = lg
+                            glottonames[lg] = [self.language_glottocode, None]
+                        elif len(languoids) == 0:
+                            glottonames[lg] = [None, None]
+                        elif len(languoids2) == 1:  # exactly one "language"
+                            self.language_glottocode = languoids2[0].id
+                            self.language_name = lg
+                            glottonames[lg] = [self.language_glottocode, None]
+                        else:
+                            self.language_glottocode = None
+                            glottotmp[lg] = True
                     else:
                         request_url = f"https://glottolog.org/glottolog?name={lg}&namequerytype=part"
                         print(lg, request_url)
@@ -162,7 +202,13 @@ class gll:
         return re.split(r"(?<!\\)%", s)[0].replace(r"\%", "%")
 
     def resolve_lgr(self, s):
-        s = re.sub(LGRPATTERN_UPPER, r"\1", s)
+        s = LGRPATTERN_UPPER.sub(r"\1", s)
+        if not LGRCASCADE.search(s):
+            return LGRPATTERN.sub(lambda m: LGRTABLE[m.group(1)], s)
+        # Resolving a name removes a backslash, which may block a preceding name - as in
+        # "\erg\dat" - or turn a preceding backslash into a new command - as in "\\erg". Since the
+        # outcome then depends on order and number of occurrences of names, we resolve names one
+        # at a time for these (rare) strings.
         for m in LGRPATTERN_LOWER.findall(s):
             g = m[0]
             s = re.sub(r"\\%s(?![a-zA-Z])" % g, g.upper(), s)
@@ -172,7 +218,7 @@ class gll:
         return s
 
     def tex2html(self, s):
-        result = self.striptex(s, html=True)
+        result = gll.striptex(self, s, html=True)
         # repeated for nested  \textsomething{\textsomethingelse{}}
         result = TEXTEXT.sub('<span class="\\1">\\2</span>', result)
         result = TEXTEXT.sub('<span class="\\1">\\2</span>', result)
@@ -180,30 +226,29 @@ class gll:
         return result
 
     def striptex(self, s, sc2upper=False, html=False):
-        result = converter.decode_Tex_Accents(s, utf8_or_ascii=1)
+        result = converter.decode_Tex_Accents_cached(s, utf8_or_ascii=1)
         if sc2upper:
-            for m in re.findall("\\\\textsc{([-\.:=<> a-zA-Z0-9]*?)}", result):
+            for m in SMALLCAPS.findall(result):
                 result = result.replace("\\textsc{%s}" % m, m.upper())
-        result = re.sub(INDEXCOMMANDS, "", result)
-        result = re.sub(LABELCOMMANDS, "", result)
-        result = re.sub(TEXSTYLEENVIRONMENT, r"\1", result)
-        for r in TEXREPLACEMENTS:
-            result = result.replace(*r)
-        for r in TEXTARGYANKS:
-            result = re.sub(r"\\%s{.*?}" % r, "", result)
-        result = re.sub(r"\footnote{[^}{]*}", "", result)
+        result = INDEXCOMMANDS.sub("", result)
+        result = LABELCOMMANDS.sub("", result)
+        result = TEXSTYLEENVIRONMENT.sub(r"\1", result)
+        result = texreplacer(result)
+        # remove TEXTARGYANKS together with their (brace-balanced) argument
+        result = texargyanker(result)
+        result = FOOTNOTE.sub("", result)
         # add " " in front of string so that lookbehind matches if at beginning of line
-        result = re.sub(BRACESPATTERN, r"\1", " " + result)[1:]
+        result = BRACESPATTERN.sub(r"\1", " " + result)[1:]
         # strip "\ " (latex protected space)
-        result = re.sub(r"(?<!\\)\\ ", " ", result)
+        result = PROTECTEDSPACE.sub(" ", result)
         if html:  # keep \textbf, \texit for the time being, to be included in <span>s
             return result
         else:
             #repeat  for nested  \textsomething{\textsomethingelse{}}
-            result = re.sub(TEXTEXT, "\\2", result)
-            result = re.sub(TEXTEXT, "\\2", result)
-            result = re.sub(BRACESPATTERN, r"\1", " " + result)[1:]
-            return re.sub(TEXTEXT, "\\2", result)
+            result = TEXTEXT.sub("\\2", result)
+            result = TEXTEXT.sub("\\2", result)
+            result = BRACESPATTERN.sub(r"\1", " " + result)[1:]
+            return TEXTEXT.sub("\\2", result)
 
     def tex2categories(self, s):
         d = {}
@@ -237,6 +282,23 @@ class gll:
             self.polarity = "negative"
 
 
+def render_html(srcwordstex, imtwordstex):
+    """
+    :return: HTML of the word-by-word aligned source and gloss words of an example.
+    """
+    imt_html = "\n".join(
+        [
+            '\t<div class="imtblock">\n\t\t<div class="srcblock">'
+            + gll.tex2html(None, t[0])
+            + '</div>\n\t\t<div class="glossblock">'
+            + gll.tex2html(None, t[1])
+            + "</div>\n\t</div>"
+            for t in zip(srcwordstex, imtwordstex)
+        ]
+    )
+    return f'<div class="imtblocks">\n{imt_html}\n</div>\n'
+
+
 def get_iso(glottocode):
     global glotto_iso6393
     if glottocode == None:
@@ -244,13 +306,18 @@ def get_iso(glottocode):
     try:
         return glotto_iso6393[glottocode]
     except KeyError:
-        request_url = f"https://glottolog.org/resource/languoid/id/{glottocode}"
-        html = requests.get(request_url).text
-        soup = BeautifulSoup(html, "html.parser")
-        try:
-            iso = soup.find("span", class_="iso639-3").a["title"]
-        except AttributeError:
-            return "und"
+        if glottolog_index is not None:
+            iso = glottolog_index.iso(glottocode)
+            if iso is None:
+                return "und"
+        else:
+            request_url = f"https://glottolog.org/resource/languoid/id/{glottocode}"
+            html = requests.get(request_url).text
+            soup = BeautifulSoup(html, "html.parser")
+            try:
+                iso = soup.find("span", class_="iso639-3").a["title"]
+            except AttributeError:
+                return "und"
         glotto_iso6393[glottocode] = iso
         print(glottocode, iso)
         return iso
@@ -277,98 +344,384 @@ def get_abbreviations(lines):
     return result
 
 
-def langsciextract(directory):
+# Output formats: One JSON file per tex file, with an indented list of examples, or one JSON Lines
+# file - optionally gzip compressed - with one compact line per example.
+OUTPUT_FORMATS = ["json", "jsonl", "jsonl.gz"]
+
+
+def json_name(filename, output_format="json"):
+    return "langscijson/%sexamples.%s" % (filename[:-4]\
+                .replace("/", "-")\
+                .replace("raw-raw_texfiles-raw-", ""), output_format)
+
+
+def iter_examples(s, filename, booklanguage, book_metalanguage, abbrkey, html=False):
+    """
+    :return: Generator of the `gll` examples in the content `s` of tex file `filename`.
+    """
+    for g in iter_gll(s):
+        presource = g["presourceline"] or ""
+        lg = g["language_name"]
+        if g["imtline2"] in (None, ""):  # standard \gll example¨
+            src = g["sourceline"]
+            imt = g["imtline1"]
+        else:
+            # we ignore the first line of \glll examples as the second line typically contains the morpheme breaks
+            src = g["imtline1"]
+            imt = g["imtline2"]
+        trs = g["translationline"]
+        try:
+            thisgll = gll(
+                presource,
+                lg,
+                src,
+                imt,
+                trs,
+                filename=filename,
+                booklanguage=booklanguage,
+                book_metalanguage=book_metalanguage,
+                abbrkey=abbrkey,
+                html=html,
+            )
+            if thisgll.book_ID in NON_CCBY_LIST:
+                continue
+        except AssertionError:
+            continue
+        yield thisgll
+
+
+def extract_examples(
+        s, filename, booklanguage, book_metalanguage, abbrkey, output_format="json", html=False):
+    """
+    :return: `(jsonname, jsons)` pair for the examples in the content `s` of tex file `filename`, \
+    or `None` if there are no examples. JSON Lines output is written right away, example by \
+    example, to a temporary file `jsonname + ".part"`; `jsons` is `None` then.
+    """
+    examples = iter_examples(s, filename, booklanguage, book_metalanguage, abbrkey, html=html)
+    jsonname = json_name(filename, output_format)
+    if output_format == "json":
+        examples = list(examples)
+        if examples != []:
+            jsons = json.dumps(
+                [ex.__dict__ for ex in examples],
+                sort_keys=True,
+                indent=4,
+                ensure_ascii=False,
+            )
+            return jsonname, jsons
+        return
+    os.makedirs("langscijson", exist_ok=True)
+    with JSONLinesWriter(jsonname + ".part", compress=output_format.endswith(".gz")) as out:
+        for ex in examples:
+            out.write(ex.__dict__)
+    if out.count:
+        return jsonname, None
+    os.remove(jsonname + ".part")
+
+
+def extract_book(directory, book, manifest=None, output_format="json", html=False):
+    """
+    Extract the examples from the tex files of one book.
+
+    :param manifest: `imtvaultcache.Manifest` of previous extraction results. Tex files whose \
+    content - and abbreviations - did not change since, are skipped if the shared mappings still \
+    provide the values their extraction has read (see `is_valid`); the output file written for \
+    them - in `output_format` - is kept.
+    :param output_format: One of `OUTPUT_FORMATS`.
+    :param html: Flag signaling whether to include the HTML of the examples in the output.
+    :return: Pair `(outputs, records)`: `list` of `(jsonname, jsons)` pairs, one per extracted tex \
+    file with examples (see `extract_examples`), and - if a `manifest` is given - `list` of `(filename, digest, data, reused)` \
+    tuples to update the manifest with, one per tex file.
+    """
+    book_ID = int(book.split("/")[-1])
+    book_metalanguage = "eng"
+    if book_ID in PORTUGUESE:
+        book_metalanguage = "por"
+    if book_ID in GERMAN:
+        book_metalanguage = "deu"
+    if book_ID in FRENCH:
+        book_metalanguage = "fra"
+    if book_ID in SPANISH:
+        book_metalanguage = "spa"
+    if book_ID in CHINESE:
+        book_metalanguage = "cmn"
+    booklanguage = ONE_LANGUAGE_BOOKS.get(int(book_ID), False)
+    glossesd = defaultdict(int)
+    excludechars = ".\\}{=~:/"
+    abbrkey = {}
+    try:
+        with open(f"{directory}/{book_ID}/abbreviations.tex") as abbrin:
+            abbrkey = get_abbreviations(abbrin.readlines())
+    except FileNotFoundError:
+        pass
+    files = glob.glob(f"{directory}/{book_ID}/chapters/*tex")
+    files = glob.glob(f"{directory}/{book_ID}/*tex")
+    # print(" found %i tex files for %s" % (len(files), book_ID))
+    res, records = [], []
+    for filename in files:
+        try:
+            s = open(filename).read()
+        except UnicodeDecodeError:
+            print("Unicode problem in %s" % filename)
+        s = s.replace(r"{\bfseries ", r"\textbf{")
+        s = s.replace(r"{\itshape ", r"\textit{")
+        s = s.replace(r"{\scshape ", r"\textsc{")
+        if abbrkey == {}:
+            try:
+                abbr1 = s.split("section*{Abbreviations}")[1]
+                abbr2 = abbr1.split(r"\section")[0]
+                abbrkey = get_abbreviations(abbr2.split("\n"))
+            except IndexError:
+                pass
+        if manifest is None:
+            output = extract_examples(
+                s, filename, booklanguage, book_metalanguage, abbrkey, output_format, html)
+        else:
+            digest = hashlib.sha256(
+                (s + json.dumps([abbrkey, html], sort_keys=True)).encode("utf8")).hexdigest()
+            data = manifest.get(
+                filename,
+                digest,
+                valid=lambda d: is_valid(d["trace"]) and (d["output"] is None or (
+                    d["output"] == json_name(filename, output_format)
+                    and os.path.exists(d["output"]))))
+            if data:
+                replay(data["trace"])
+                records.append((filename, digest, data, True))
+                continue
+            with tracking_shared() as tracked:
+                output = extract_examples(
+                    s, filename, booklanguage, book_metalanguage, abbrkey, output_format, html)
+            trace = {name: (d.reads, d.writes) for name, d in tracked.items()}
+            replay(trace)
+            records.append(
+                (filename, digest, dict(trace=trace, output=output[0] if output else None), False))
+        if output:
+            res.append(output)
+    return res, records
+
+
+class TrackedDict(dict):
+    """
+    A dict recording the values read from it - unless they have been written before - and the
+    values written to it.
+
+    The observed value of a key is `observe(value)` - i.e. only the part of the value which matters
+    to the reader - or `MISSING`.
+    """
+    MISSING = "<missing>"
+
+    def __init__(self, d, observe=None):
+        super().__init__(d)
+        self.observe = observe or (lambda v: v)
+        self.reads, self.writes = {}, {}
+
+    @classmethod
+    def observed(cls, d, key, observe=None):
+        if key in d:
+            return (observe or (lambda v: v))(dict.__getitem__(d, key))
+        return cls.MISSING
+
+    def _read(self, key):
+        if key not in self.writes and key not in self.reads:
+            self.reads[key] = self.observed(self, key, self.observe)
+
+    def __getitem__(self, key):
+        self._read(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self._read(key)
+        return super().get(key, default)
+
+    def __setitem__(self, key, value):
+        self.writes[key] = value
+        super().__setitem__(key, value)
+
+
+# The mappings shared across books, with functions computing what matters of a value to `gll`:
+SHARED = {
+    "glottonames": operator.itemgetter(0),
+    "glotto_iso6393": None,
+    "glottotmp": bool,
+}
+
+
+@contextlib.contextmanager
+def tracking_shared():
+    """
+    Replace the shared mappings with `TrackedDict` copies for the duration of the context.
+
+    :return: `dict` mapping the names of the shared mappings to their `TrackedDict` copies.
+    """
+    shared = {name: globals()[name] for name in SHARED}
+    try:
+        for name, observe in SHARED.items():
+            globals()[name] = TrackedDict(shared[name], observe)
+        yield {name: globals()[name] for name in SHARED}
+    finally:
+        globals().update(shared)
+
+
+def replay(trace):
+    """
+    Apply the reads and writes recorded in `trace` to the shared mappings - so that a skipped tex
+    file leaves the same trace and updates as an extracted one.
+    """
+    for name, (reads, writes) in trace.items():
+        for key in reads:
+            globals()[name].get(key)
+        for key, value in writes.items():
+            globals()[name][key] = value
+
+
+def extract_book_tracked(args):
+    """
+    Run `extract_book` in a worker process, on private copies of the shared mappings as loaded
+    at startup - no matter which books this worker has processed before.
+
+    :return: Tuple `(book, outputs, records, trace)` where `trace` maps the names of the shared \
+    mappings to pairs `(reads, writes)`.
+    """
+    directory, book, manifest, output_format, html = args
+    with tracking_shared() as tracked:
+        outputs, records = extract_book(
+            directory, book, manifest=manifest, output_format=output_format, html=html)
+        return book, outputs, records, {name: (d.reads, d.writes) for name, d in tracked.items()}
+
+
+def is_valid(trace):
+    """
+    A book processed by `extract_book_tracked` has the same result as in a serial run, if it
+    observed the same values as it would in the shared mappings updated by all previous books.
+
+    `get_iso` returns the same, whether the ISO code is looked up in `glotto_iso6393` or fetched from
+    Glottolog (and then added to `glotto_iso6393`). So for `glotto_iso6393`, fetching the value a
+    previous book has added is just as good as reading it.
+    """
+    for name, (reads, writes) in trace.items():
+        for key, value in reads.items():
+            current = TrackedDict.observed(globals()[name], key, SHARED[name])
+            if name == "glotto_iso6393" and value == TrackedDict.MISSING and key in writes \
+                    and current != TrackedDict.MISSING:
+                value = writes[key]
+            if current != value:
+                return False
+    return True
+
+
+def extractor_version():
+    """
+    Recorded extraction results become invalid when the code - including the rules in
+    `imtvaultconstants` - or the source of language names changes.
+    """
+    here = pathlib.Path(__file__).parent
+    return hashlib.sha256(''.join([
+        (here / name).read_text(encoding='utf8') for name in [
+            "extractgll.py",
+            "imtvaultconstants.py",
+            "lgrlist.py",
+            "titlemapping.py",
+            "LaTexAccents.py",
+            "texrewriter.py",
+            "trieregex.py",
+            "gllscanner.py",
+            "jsonstream.py",
+        ]] + [glottolog_index.glottolog if glottolog_index else "glottolog.org"]
+    ).encode('utf8')).hexdigest()
+
+
+def langsciextract(
+        directory,
+        workers=1,
+        glottolog_index=None,
+        incremental=True,
+        output_format="json",
+        html=False):
+    """
+    :param workers: Number of worker processes to shard books across. Books are still processed - \
+    and the shared mappings updated - in the same order as in a serial run: A book whose result \
+    depends on updates made by previous books is re-processed in the main process.
+    :param glottolog_index: Path of an offline Glottolog index, built with \
+    `cldfbench imtvault.glottologindex`, to resolve language names without network access.
+    :param incremental: Flag signaling whether to skip tex files which did not change since the \
+    last run, as recorded in the manifest in `.cache/extraction`. Output files of tex files which \
+    no longer exist - or no longer have examples - are removed.
+    :param output_format: One of `OUTPUT_FORMATS`. With JSON Lines output, each example is written \
+    as soon as it is extracted.
+    :param html: Flag signaling whether to include the HTML of the examples in the output - which \
+    is otherwise rendered when needed, see `render_html`.
+    """
+    open_glottolog_index(glottolog_index)
     globstring = f"{directory}/*"
     books = glob.glob(globstring)
     # books = glob.glob(f"{directory}/16")
-    for book in books:
-        book_ID = int(book.split("/")[-1])
-        if book_ID in SUPERSEDED:
-            continue
-        book_metalanguage = "eng"
-        if book_ID in PORTUGUESE:
-            book_metalanguage = "por"
-        if book_ID in GERMAN:
-            book_metalanguage = "deu"
-        if book_ID in FRENCH:
-            book_metalanguage = "fra"
-        if book_ID in SPANISH:
-            book_metalanguage = "spa"
-        if book_ID in CHINESE:
-            book_metalanguage = "cmn"
-        booklanguage = ONE_LANGUAGE_BOOKS.get(int(book_ID), False)
-        glossesd = defaultdict(int)
-        excludechars = ".\\}{=~:/"
-        abbrkey = {}
-        try:
-            with open(f"{directory}/{book_ID}/abbreviations.tex") as abbrin:
-                abbrkey = get_abbreviations(abbrin.readlines())
-        except FileNotFoundError:
-            pass
-        files = glob.glob(f"{directory}/{book_ID}/chapters/*tex")
-        files = glob.glob(f"{directory}/{book_ID}/*tex")
-        # print(" found %i tex files for %s" % (len(files), book_ID))
-        for filename in files:
+    books = [book for book in books if int(book.split("/")[-1]) not in SUPERSEDED]
+    manifest = Manifest(pathlib.Path(".cache") / "extraction", extractor_version()) \
+        if incremental else None
+    previous = set(manifest.files) if manifest else set()
+    filenames, reused = [], 0
+
+    def remove(jsonnames):
+        for jsonname in jsonnames:
+            if os.path.exists(jsonname):
+                print("    removing", jsonname)
+                os.remove(jsonname)
+
+    def write(outputs, records):
+        nonlocal reused
+        for jsonname, jsons in outputs:
             try:
-                s = open(filename).read()
-            except UnicodeDecodeError:
-                print("Unicode problem in %s" % filename)
-            s = s.replace(r"{\bfseries ", r"\textbf{")
-            s = s.replace(r"{\itshape ", r"\textit{")
-            s = s.replace(r"{\scshape ", r"\textsc{")
-            if abbrkey == {}:
-                try:
-                    abbr1 = s.split("section*{Abbreviations}")[1]
-                    abbr2 = abbr1.split(r"\section")[0]
-                    abbrkey = get_abbreviations(abbr2.split("\n"))
-                except IndexError:
-                    pass
-            examples = []
-            for g in [m.groupdict() for m in GLL.finditer(s)]:
-                presource = g["presourceline"] or ""
-                lg = g["language_name"]
-                if g["imtline2"] in (None, ""):  # standard \gll example¨
-                    src = g["sourceline"]
-                    imt = g["imtline1"]
-                else:
-                    # we ignore the first line of \glll examples as the second line typically contains the morpheme breaks
-                    src = g["imtline1"]
-                    imt = g["imtline2"]
-                trs = g["translationline"]
-                try:
-                    thisgll = gll(
-                        presource,
-                        lg,
-                        src,
-                        imt,
-                        trs,
-                        filename=filename,
-                        booklanguage=booklanguage,
-                        book_metalanguage=book_metalanguage,
-                        abbrkey=abbrkey,
-                    )
-                    if thisgll.book_ID in NON_CCBY_LIST:
-                        continue
-                except AssertionError:
-                    continue
-                examples.append(thisgll)
-            if examples != []:
-                jsons = json.dumps(
-                    [ex.__dict__ for ex in examples],
-                    sort_keys=True,
-                    indent=4,
-                    ensure_ascii=False,
-                )
-                try:
-                    os.mkdir('langscijson')
-                except FileExistsError:
-                    pass
-                jsonname = "langscijson/%sexamples.json" % filename[:-4]\
-                            .replace("/", "-")\
-                            .replace("raw-raw_texfiles-raw-", "")
-                print("   ", jsonname)
+                os.mkdir('langscijson')
+            except FileExistsError:
+                pass
+            print("   ", jsonname)
+            if jsons is None:
+                os.replace(jsonname + ".part", jsonname)
+            else:
                 with open(jsonname, "w", encoding="utf8") as jsonout:
                     jsonout.write(jsons)
+        for filename, digest, data, skipped in records:
+            filenames.append(filename)
+            if skipped:
+                reused += 1
+            else:
+                manifest.set(filename, digest, data)
+                # Remove output of a previous run - in any format - which has not been replaced.
+                remove(
+                    json_name(filename, fmt) for fmt in OUTPUT_FORMATS
+                    if json_name(filename, fmt) != data["output"])
+
+    if workers > 1:
+        with multiprocessing.Pool(
+                workers, initializer=open_glottolog_index, initargs=(glottolog_index,)) as pool:
+            for book, outputs, records, trace in pool.imap(
+                    extract_book_tracked,
+                    [(directory, book, manifest, output_format, html) for book in books]):
+                if is_valid(trace):
+                    for name, (_, writes) in trace.items():
+                        globals()[name].update(writes)
+                else:
+                    print("re-processing", book)
+                    # Discard the JSON Lines output written by the worker.
+                    for jsonname, jsons in outputs:
+                        if jsons is None:
+                            os.remove(jsonname + ".part")
+                    outputs, records = extract_book(
+                        directory, book, manifest=manifest, output_format=output_format, html=html)
+                write(outputs, records)
+    else:
+        for book in books:
+            write(*extract_book(
+                directory, book, manifest=manifest, output_format=output_format, html=html))
+
+    if manifest:
+        remove(
+            json_name(filename, fmt)
+            for filename in sorted(previous - set(filenames)) for fmt in OUTPUT_FORMATS)
+        manifest.write(filenames)
+        print("{} tex files unchanged, {} extracted".format(reused, len(filenames) - reused))
+
     with open("glottonames.json", "w") as namesout:
         namesout.write(
             json.dumps(glottonames, sort_keys=True, indent=4, ensure_ascii=False)
@@ -379,4 +732,46 @@ def langsciextract(directory):
         )
 
 if __name__ == "__main__":
-    langsciextract('raw/raw_texfiles/raw')
+    parser = argparse.ArgumentParser(
+        description="Extract interlinear examples from the tex sources of LangSci books.")
+    parser.add_argument("directory", nargs="?", default="raw/raw_texfiles/raw")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to shard books across (0 means one per CPU)",
+    )
+    parser.add_argument(
+        "--glottolog-index",
+        default=None,
+        help="Offline Glottolog index (see `cldfbench imtvault.glottologindex`) to resolve language "
+             "names without querying glottolog.org",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="json",
+        help="Format of the output files: an indented JSON list per tex file, or JSON Lines - "
+             "written example by example, optionally gzip compressed",
+    )
+    parser.add_argument(
+        "--html",
+        action="store_true",
+        default=False,
+        help="Include the HTML of the examples in the output, rather than only the tex words it "
+             "can be rendered from",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        default=False,
+        help="Extract all tex files, rather than only those changed since the last run",
+    )
+    args = parser.parse_args()
+    langsciextract(
+        args.directory,
+        workers=args.workers or os.cpu_count(),
+        glottolog_index=args.glottolog_index,
+        incremental=not args.full,
+        output_format=args.format,
+        html=args.html)
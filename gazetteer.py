@@ -0,0 +1,48 @@
+"""
+An offline entity linker, tagging the known surface forms of entities in a text.
+
+The surface forms - e.g. collected from the results of the online NER service - are compiled into
+one regular expression, with shared prefixes factored out by `trie_regex`. So a text is scanned
+once, no matter how many forms are known, and each character is tested at most once per trie level,
+much like with an Aho-Corasick automaton. Forms only match as whole words; of overlapping forms, the
+leftmost - and of those the longest - is tagged. Whitespace in forms is collapsed to single spaces,
+so texts must be normalized the same way.
+"""
+import re
+import collections
+
+from trieregex import trie_regex
+
+__all__ = ['Gazetteer']
+
+
+class Gazetteer:
+    def __init__(self, forms):
+        """
+        :param forms: Iterable of `(form, id)` pairs - a form listed with more than one id is \
+        linked to the most frequent one.
+        """
+        counts = collections.defaultdict(collections.Counter)
+        for form, id_ in forms:
+            form = ' '.join(form.split())
+            if form:
+                counts[form][id_] += 1
+        # Ties are broken by id, to make the result independent of the order of `forms`.
+        self.forms = {
+            form: sorted(c.items(), key=lambda i: (-i[1], i[0]))[0][0] for form, c in counts.items()}
+        self.pattern = re.compile(
+            r'(?<!\w)(?:{})(?!\w)'.format(trie_regex(self.forms))) if self.forms else None
+
+    def __len__(self):
+        return len(self.forms)
+
+    def tag(self, text):
+        """
+        :param text: Text with whitespace collapsed, like the forms.
+        :return: `dict` mapping the ids of the entities found in `text` to their forms.
+        """
+        res = {}
+        if self.pattern:
+            for m in self.pattern.finditer(text):
+                res.setdefault(self.forms[m.group()], m.group())
+        return res
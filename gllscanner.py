@@ -0,0 +1,200 @@
+"""
+Find `\\gll` examples in LaTeX source - i.e. the matches of `imtvaultconstants.GLL` - in one forward
+pass over the lines.
+
+`GLL.finditer` tries the regex - with several lazy `.*?` groups and optional groups - at every
+position of a chapter, which is slow for big chapters. `iter_gll` only looks at positions where an
+example can start - `\\ili{`, `\\langinfo{` or `\\gll` - and then checks the following lines one by
+one, reproducing what the regex would match, including its quirks:
+
+- An `\\ili`/`\\langinfo` line must end with `\\\\` (plus spaces) and be immediately followed by
+  the `\\gll` line; the language name extends to the first closing brace.
+- Source and gloss lines must end with `\\\\` directly followed by the newline. Leading spaces and
+  tabs and trailing spaces are stripped.
+- Blank lines are allowed after the gloss lines, but not between source and gloss line.
+- A second gloss line is used only if a translation line follows it; otherwise it is tried as the
+  translation line.
+- The translation starts after `\\glt` or `\\trans` plus any whitespace - including newlines - and
+  extends to the end of the line.
+
+Running this module as script checks `iter_gll` against `GLL.finditer` for the given files and,
+with `--benchmark`, compares the time for both:
+
+    python gllscanner.py --benchmark raw/raw_texfiles/raw/298/chapters/*.tex
+"""
+import re
+import sys
+import time
+import argparse
+
+__all__ = ['iter_gll']
+
+START = re.compile(r"\\(?:(?:ili|langinfo)\{|gll)")
+TRANSLATION_COMMANDS = ("\\glt", "\\trans")
+
+
+def _line(s, i):
+    """
+    :return: `(line, end)` pair for the line starting at `i`, with `end` the index of the newline, \
+    or `None` if the line is not terminated.
+    """
+    end = s.find("\n", i)
+    return (None, None) if end == -1 else (s[i:end], end)
+
+
+def _backslashed(line):
+    """
+    The content of a source or gloss line, i.e. without leading whitespace, trailing spaces and the
+    final `\\\\` - or `None` if the line does not end with `\\\\`.
+    """
+    line = line.lstrip(" \t")
+    if not line.endswith("\\\\"):
+        return None
+    return line[:-2].rstrip(" ")
+
+
+def _skip_newlines(s, i):
+    while s.startswith("\n", i):
+        i += 1
+    return i
+
+
+def _presource(s, i):
+    """
+    :return: `(language_name, end)` for a `\\ili`/`\\langinfo` line starting at `i`, with `end` \
+    the index after the newline, or `None`.
+    """
+    line, end = _line(s, i)
+    if line is None:
+        return None
+    j = k = line.index("{") + 1
+    while True:
+        k = line.find("}", k)
+        if k == -1:
+            return None
+        if line[k + 1:].rstrip(" ").endswith("\\\\"):
+            return line[j:k], end + 1
+        k += 1
+
+
+def _translation(s, i):
+    """
+    :return: `(translationline, end)` for a translation line starting at `i`, or `None`.
+    """
+    line, _ = _line(s, i)
+    if line is None:
+        line = s[i:]
+    stripped = line.lstrip(" \t")
+    i += len(line) - len(stripped)
+    for cmd in TRANSLATION_COMMANDS:
+        if stripped.startswith(cmd):
+            i += len(cmd)
+            break
+    else:
+        return None
+    j = i
+    while j < len(s) and s[j] in " \t\n":
+        j += 1
+    end = s.find("\n", j)
+    if end != -1:
+        return s[j:end], end + 1
+    # No newline after the translation: the regex backtracks to the last newline of the whitespace.
+    end = s.rfind("\n", i, j)
+    return ("", end + 1) if end != -1 else None
+
+
+def _match(s, start):
+    """
+    :return: `(groupdict, end)` for an example starting at `start`, or `None`.
+    """
+    res = dict(
+        presourceline=None, language_name=None, sourceline=None, imtline1=None, imtline2=None,
+        translationline=None)
+    i = start
+    if not s.startswith("\\gll", i):
+        presource = _presource(s, i)
+        if presource is None:
+            return None
+        res["language_name"], i = presource
+        res["presourceline"] = s[start:i]
+        if not s.startswith("\\gll", i):
+            return None
+    line, end = _line(s, i + 4)
+    res["sourceline"] = _backslashed(line) if line is not None else None
+    if res["sourceline"] is None:
+        return None
+    line, end = _line(s, end + 1)
+    res["imtline1"] = _backslashed(line) if line is not None else None
+    if res["imtline1"] is None:
+        return None
+    i = _skip_newlines(s, end + 1)
+    line, end = _line(s, i)
+    if line is not None:
+        imtline2 = _backslashed(line)
+        if imtline2 is not None:
+            translation = _translation(s, _skip_newlines(s, end + 1))
+            if translation is not None:
+                res["imtline2"] = imtline2
+                res["translationline"], end = translation
+                return res, end
+    translation = _translation(s, i)
+    if translation is None:
+        return None
+    res["translationline"], end = translation
+    return res, end
+
+
+def iter_gll(s):
+    """
+    :return: Generator of the `groupdict`s of the matches of `imtvaultconstants.GLL` in `s`.
+    """
+    pos = 0
+    while True:
+        m = START.search(s, pos)
+        if not m:
+            return
+        match = _match(s, m.start())
+        if match:
+            yield match[0]
+            pos = match[1]
+        else:
+            pos = m.start() + 1
+
+
+def main(args=None):  # pragma: no cover
+    from imtvaultconstants import GLL
+
+    parser = argparse.ArgumentParser(description='Check iter_gll against GLL.finditer.')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument(
+        '--benchmark',
+        help='Compare time per file of iter_gll and GLL.finditer',
+        action='store_true',
+        default=False)
+    args = parser.parse_args(args)
+    mismatches, times = 0, [0, 0]
+    for fname in args.files:
+        with open(fname, encoding='utf8') as f:
+            s = f.read()
+        start = time.perf_counter()
+        expected = [m.groupdict() for m in GLL.finditer(s)]
+        times[0] += time.perf_counter() - start
+        start = time.perf_counter()
+        got = list(iter_gll(s))
+        times[1] += time.perf_counter() - start
+        if got != expected:
+            mismatches += 1
+            print('{}: {} examples expected, {} found'.format(fname, len(expected), len(got)))
+            for e, g in zip(expected, got):
+                if e != g:
+                    print('  expected: {}\n  got:      {}'.format(e, g))
+                    break
+    print('{} files, {} mismatches'.format(len(args.files), mismatches))
+    if args.benchmark:
+        print('GLL.finditer: {:.3f}s, iter_gll: {:.3f}s ({:.1f}x)'.format(
+            times[0], times[1], times[0] / times[1] if times[1] else float('inf')))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+An offline index of Glottolog languoid names, to resolve language names during extraction without
+querying glottolog.org.
+
+The index is a UTF-8 text file - built from a Glottolog data checkout with
+`cldfbench imtvault.glottologindex` - with a JSON header line followed by two sections of
+tab-separated lines:
+- `names`: normalized name (or alternative name) and Glottocode, sorted,
+- `languoids`: Glottocode, level, ISO 639-3 code and family name, sorted.
+
+The file is memory-mapped, and lookups search the sorted sections with bisection. Name searches
+like Glottolog's "part" name query - i.e. for names containing a string - scan the names section
+with `mmap.find`, so loading the index takes no time, and it is shared between worker processes by
+the OS.
+"""
+import re
+import json
+import mmap
+import collections
+import unicodedata
+
+__all__ = ['normalize', 'write_index', 'GlottologIndex', 'Languoid']
+
+VERSION = 1
+Languoid = collections.namedtuple('Languoid', 'id level iso family')
+
+
+def normalize(name):
+    name = unicodedata.normalize('NFC', name).casefold()
+    return re.sub(r'\s+', ' ', re.sub(r'[\x00-\x1f]', ' ', name)).strip()
+
+
+def _lines(rows):
+    return b''.join(sorted('\t'.join(row).encode('utf8') + b'\n' for row in rows))
+
+
+def write_index(path, languoids, version=None):
+    """
+    :param languoids: Iterable of `(Languoid, names)` pairs.
+    :param version: Glottolog version, recorded in the header.
+    """
+    names, langs = set(), []
+    for lang, lnames in languoids:
+        langs.append([re.sub(r'[\t\n]', ' ', v or '') for v in lang])
+        names.update((normalize(n), lang.id) for n in lnames if normalize(n))
+    sections = collections.OrderedDict([('names', _lines(names)), ('languoids', _lines(langs))])
+    offsets, offset = {}, 0
+    for name, data in sections.items():
+        offsets[name] = [offset, offset + len(data)]
+        offset += len(data)
+    with path.open('wb') as f:
+        f.write(json.dumps(dict(version=VERSION, glottolog=version, sections=offsets)).encode('utf8'))
+        f.write(b'\n')
+        for data in sections.values():
+            f.write(data)
+
+
+class GlottologIndex:
+    def __init__(self, path):
+        self.path = path
+        with path.open('rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_end = self.mm.find(b'\n') + 1
+        header = json.loads(self.mm[:header_end].decode('utf8'))
+        if header.get('version') != VERSION:
+            raise ValueError('Unsupported version of Glottolog index {}'.format(path))
+        self.glottolog = header['glottolog']
+        self.sections = {
+            name: (start + header_end, end + header_end)
+            for name, (start, end) in header['sections'].items()}
+
+    def _line_start(self, section, pos):
+        return max(self.sections[section][0], self.mm.rfind(b'\n', 0, pos) + 1)
+
+    def _bisect(self, section, key):
+        """
+        :return: Offset of the first line in `section` with first field >= `key`.
+        """
+        lo, hi = self.sections[section]
+        while lo < hi:
+            start = self._line_start(section, (lo + hi) // 2)
+            if self.mm[start:self.mm.find(b'\t', start)] < key:
+                lo = self.mm.find(b'\n', start) + 1
+            else:
+                hi = start
+        return lo
+
+    def _rows(self, section, key):
+        """
+        :return: Generator of the rows - as lists of fields - with first field `key`.
+        """
+        key = key.encode('utf8')
+        pos, end = self._bisect(section, key), self.sections[section][1]
+        while pos < end:
+            line_end = self.mm.find(b'\n', pos)
+            row = self.mm[pos:line_end].decode('utf8').split('\t')
+            if row[0].encode('utf8') != key:
+                break
+            yield row
+            pos = line_end + 1
+
+    def languoid(self, glottocode):
+        for row in self._rows('languoids', glottocode):
+            return Languoid(*[v or None for v in row])
+
+    def iso(self, glottocode):
+        lang = self.languoid(glottocode)
+        return lang.iso if lang else None
+
+    def search(self, name, part=True):
+        """
+        :param part: Flag signaling whether to search for names containing `name` (like \
+        Glottolog's "part" name query), rather than for names equal to `name`.
+        :return: `list` of `Languoid`s with a matching name or alternative name.
+        """
+        name = normalize(name)
+        if not name:
+            return []
+        if not part:
+            gcs = {row[1] for row in self._rows('names', name)}
+        else:
+            gcs, needle = set(), name.encode('utf8')
+            pos, end = self.sections['names']
+            while True:
+                pos = self.mm.find(needle, pos, end)
+                if pos == -1:
+                    break
+                start = self._line_start('names', pos)
+                tab, line_end = self.mm.find(b'\t', start), self.mm.find(b'\n', pos)
+                if pos + len(needle) <= tab:
+                    gcs.add(self.mm[tab + 1:line_end].decode('utf8'))
+                pos = line_end + 1
+        return [self.languoid(gc) for gc in sorted(gcs)]
@@ -0,0 +1,269 @@
+"""
+Caches to speed up repeated runs of `cldfbench makecldf`.
+
+All caches live in a directory below the dataset directory (see `Dataset.cache_dir`), which is
+not under version control. Removing this directory is always safe.
+"""
+import re
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import collections
+
+__all__ = ['file_digest', 'Manifest', 'PickleCache', 'GlottologSnapshot', 'IGTCache']
+
+
+def file_digest(p):
+    return hashlib.sha256(p.read_bytes()).hexdigest()
+
+
+class Manifest:
+    """
+    A manifest of input files, mapping the path of each file to the SHA256 digest of its content
+    and to the data derived from it. Data is stored in files next to the manifest, keyed by path
+    and content digest - since data may depend on the path, too; it is re-used only if the content
+    digest of the input file matches.
+
+    Since the data also depends on the code deriving it, the manifest is keyed by a `version` as
+    well: Loading a manifest written with a different version drops all entries.
+    """
+    def __init__(self, d, version):
+        self.dir = d
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.path = d / 'manifest.json'
+        self.version = version
+        self.files = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding='utf8'))
+            if data.get('version') == version:
+                self.files = data['files']
+        self.hits, self.misses = 0, 0
+
+    @staticmethod
+    def _data_key(name, digest):
+        return hashlib.sha256('{}\n{}'.format(name, digest).encode('utf8')).hexdigest()
+
+    def _data_path(self, name, digest):
+        return self.dir / '{}.json'.format(self._data_key(name, digest))
+
+    def is_current(self, name, digest):
+        return self.files.get(name) == digest and self._data_path(name, digest).exists()
+
+    def get(self, name, digest, valid=None):
+        """
+        :param valid: Optional callable to check whether the stored data is still valid.
+        :return: The data stored for input file `name`, if its content digest matches, else `None`.
+        """
+        if self.is_current(name, digest):
+            data = json.loads(self._data_path(name, digest).read_text(encoding='utf8'))
+            if valid is None or valid(data):
+                self.hits += 1
+                return data
+        self.misses += 1
+
+    def set(self, name, digest, data):
+        self.files[name] = digest
+        self._data_path(name, digest).write_text(
+            json.dumps(data, ensure_ascii=False, separators=(',', ':')), encoding='utf8')
+
+    def write(self, names=None):
+        """
+        Write the manifest, dropping entries for input files not listed in `names` (if given), and
+        remove data files which are no longer referenced.
+        """
+        if names is not None:
+            names = set(names)
+            self.files = {k: v for k, v in self.files.items() if k in names}
+        referenced = {self._data_key(name, digest) for name, digest in self.files.items()}
+        for p in self.dir.glob('*.json'):
+            if p != self.path and p.stem not in referenced:
+                p.unlink()
+        self.path.write_text(
+            json.dumps(dict(version=self.version, files=self.files), indent=1, sort_keys=True),
+            encoding='utf8')
+
+
+class PickleCache:
+    """
+    A cache of Python objects derived from input files, keyed by the SHA256 digest of the file
+    content, and stored in a single pickle file. Like a `Manifest`, the cache is dropped when loaded
+    with a different `version`.
+
+    Only objects looked up or added since loading are written back, i.e. objects for input files
+    which have been changed or removed are pruned.
+    """
+    def __init__(self, path, version):
+        self.path, self.version = path, version
+        self.objects, self.used = {}, set()
+        if path.exists():
+            try:
+                with path.open('rb') as f:
+                    data = pickle.load(f)
+                if data['version'] == version:
+                    self.objects = data['objects']
+            except Exception:  # noqa: E722 - An unreadable cache is just an empty cache.
+                pass
+        self.hits, self.misses = 0, 0
+
+    def __contains__(self, digest):
+        return digest in self.objects
+
+    def get(self, digest):
+        if digest in self.objects:
+            self.hits += 1
+            self.used.add(digest)
+            return self.objects[digest]
+        self.misses += 1
+
+    def set(self, digest, obj):
+        self.objects[digest] = obj
+        self.used.add(digest)
+
+    def write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open('wb') as f:
+            pickle.dump(dict(
+                version=self.version,
+                objects={k: v for k, v in self.objects.items() if k in self.used}), f)
+
+
+Languoid = collections.namedtuple('Languoid', 'id name iso latitude longitude')
+
+
+class _Snapshot(dict):
+    def __init__(self, load, items):
+        super().__init__(items)
+        self.load, self.added = load, 0
+
+    def __missing__(self, key):
+        self[key] = self.load(key)
+        self.added += 1
+        return self[key]
+
+
+class GlottologSnapshot:
+    """
+    A compact snapshot of the Glottolog data used by `cmd_makecldf`, i.e. of the few hundred
+    languoids referenced in the examples (restricted to the attributes we use) and of the mapping of
+    the meta-language ISO codes to Glottocodes.
+
+    The snapshot provides `cached_languoids` and `glottocode_by_iso` just like the Glottolog API,
+    falling back to the full API - which means loading the complete languoid tree - only for keys
+    not yet in the snapshot. Snapshots are keyed by Glottolog version, so they never need to be
+    invalidated.
+    """
+    def __init__(self, path, api):
+        """
+        :param api: Callable returning a `CachingGlottologAPI` instance, only called when needed.
+        """
+        self.path = path
+        data = json.loads(path.read_text(encoding='utf8')) if path.exists() else {}
+        self.cached_languoids = _Snapshot(
+            lambda gc: self._languoid(api().cached_languoids[gc]),
+            {gc: Languoid(*v) for gc, v in data.get('languoids', {}).items()})
+        self.glottocode_by_iso = _Snapshot(
+            lambda iso: api().glottocode_by_iso[iso], data.get('glottocode_by_iso', {}))
+
+    @classmethod
+    def from_catalog(cls, d, catalog):
+        """
+        :return: `GlottologSnapshot` for the version of the Glottolog `catalog`, or `None` if the \
+        version cannot be determined.
+        """
+        try:
+            version = catalog.describe()
+        except ValueError:  # Not a git repository.
+            return None
+        return cls(
+            d / 'glottolog-{}.json'.format(re.sub(r'[^a-zA-Z0-9._-]', '_', version)),
+            lambda: catalog.api)
+
+    @staticmethod
+    def _languoid(lang):
+        return Languoid(lang.id, lang.name, lang.iso, lang.latitude, lang.longitude)
+
+    @property
+    def misses(self):
+        return self.cached_languoids.added + self.glottocode_by_iso.added
+
+    def write(self):
+        if self.misses:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(dict(
+                languoids={gc: list(lang) for gc, lang in sorted(self.cached_languoids.items())},
+                glottocode_by_iso=dict(sorted(self.glottocode_by_iso.items())),
+            ), ensure_ascii=False, separators=(',', ':')), encoding='utf8')
+
+
+class IGTCache:
+    """
+    A persistent, content-addressed cache for results of IGT analysis, stored in a SQLite database.
+
+    Keys are SHA256 digests of the JSON serialized inputs, values are arbitrary JSON serializable
+    data. The number of entries is bounded by `maxsize`; `evict` removes the least recently used
+    entries exceeding this bound.
+
+    Lookups are immediate, while additions and usage timestamps are only written to the database
+    with `flush`, to keep the number of transactions small. Since SQLite handles locking, a cache
+    can be used from several processes at once - but each process must open its own instance.
+    Creating the database - which needs an exclusive lock - must happen once, before other
+    processes open it with `create=False`. Writes failing because the database is locked are
+    retried.
+    """
+    def __init__(self, path, maxsize=2 ** 18, create=True):
+        self.db = sqlite3.connect(str(path), timeout=300)
+        if create:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS igt (key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)')
+        self.maxsize = maxsize
+        self.hits, self.misses = 0, 0
+        self._new, self._used = {}, set()
+
+    @staticmethod
+    def key(*args):
+        return hashlib.sha256(
+            json.dumps(args, sort_keys=True, ensure_ascii=False).encode('utf8')).hexdigest()
+
+    def get(self, key):
+        if key in self._new:
+            self.hits += 1
+            return json.loads(self._new[key])
+        row = self.db.execute('SELECT value FROM igt WHERE key = ?', (key,)).fetchone()
+        if row:
+            self.hits += 1
+            self._used.add(key)
+            return json.loads(row[0])
+        self.misses += 1
+
+    def set(self, key, value):
+        self._new[key] = json.dumps(value, ensure_ascii=False)
+
+    def flush(self, retries=5):
+        now = time.time()
+        for attempt in range(retries + 1):
+            try:
+                with self.db:
+                    self.db.executemany(
+                        'INSERT OR REPLACE INTO igt (key, value, used) VALUES (?, ?, ?)',
+                        [(k, v, now) for k, v in self._new.items()])
+                    self.db.executemany(
+                        'UPDATE igt SET used = ? WHERE key = ?', [(now, k) for k in self._used])
+                break
+            except sqlite3.OperationalError as e:
+                # SQLITE_BUSY may be raised without waiting for the timeout, e.g. when a lock must
+                # be upgraded, so we retry with backoff.
+                if 'locked' not in str(e) or attempt == retries:
+                    raise
+                time.sleep(0.1 * 2 ** attempt)
+        self._new, self._used = {}, set()
+
+    def evict(self):
+        self.flush()
+        with self.db:
+            self.db.execute(
+                'DELETE FROM igt WHERE key IN '
+                '(SELECT key FROM igt ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
@@ -0,0 +1,285 @@
+"""
+Benchmark the hot path of `cldfbench makecldf` and compare the results with stored baselines.
+
+The benchmarks run on the fixed sample of extracted examples in `etc/benchmark/examples/`:
+- micro benchmarks for the per-example functions in `cldfbench_imtvault`, i.e. for `clean`,
+  `recombine`, `clean_abbr`, `filtered` and the IGT analysis,
+- an end-to-end benchmark, running `cmd_makecldf` on the sample and writing the CLDF data to a
+  temporary directory - once with empty caches ("cold") and once re-using the caches ("warm").
+
+For each benchmark, throughput (items per second, taking the best of `--repeat` runs) and peak
+memory (as traced by `tracemalloc` in a separate run) are compared with the baseline in
+`etc/benchmark/baseline.json`. The command fails, if one of them is worse than the baseline by more
+than `--threshold`.
+
+Since throughput depends on the machine, the baseline should be updated - running with
+`--update-baseline` - on the machine used for comparisons, before making changes.
+
+The Glottolog data for the sample is read from `etc/benchmark/glottolog.json`. If the sample is
+changed, this file can be completed by passing a Glottolog clone via `--glottolog`.
+"""
+import os
+import json
+import math
+import itertools
+import time
+import shutil
+import pathlib
+import argparse
+import tempfile
+import tracemalloc
+import collections
+
+from cldfbench.cli_util import add_catalog_spec, IGNORE_MISSING
+from clldutils.clilib import Table, add_format
+
+import cldfbench_imtvault
+from cldfbench_imtvault import (
+    Dataset, EXAMPLE_FIELDS, normalize, clean, recombine, clean_abbr, filtered, get_abbrs,
+    analyze_igt,
+)
+from jsonstream import iter_objects
+from imtvaultcache import GlottologSnapshot
+
+
+def register(parser):
+    add_format(parser, default='simple')
+    add_catalog_spec(parser, 'glottolog', default=IGNORE_MISSING)
+    parser.add_argument(
+        '--threshold',
+        help='Maximal tolerated relative decrease of throughput or increase of peak memory',
+        type=float,
+        default=0.25)
+    parser.add_argument(
+        '--repeat',
+        help='Number of timed runs per benchmark',
+        type=int,
+        default=5)
+    parser.add_argument(
+        '--update-baseline',
+        help='Store the results as new baseline',
+        action='store_true',
+        default=False)
+
+
+class BenchmarkDataset(Dataset):
+    """
+    The dataset, with `extracted_examples/` and `etc/bibtex/` restricted to the sample, in a
+    temporary directory.
+    """
+    def __init__(self, d, sample):
+        self.dir = d
+        super().__init__()
+        self.cache_name = '.cache'
+        self.dir.joinpath('extracted_examples').mkdir()
+        self.etc_dir.joinpath('bibtex').mkdir(parents=True)
+        bibtex_dir = Dataset().etc_dir / 'bibtex'
+        for p in sample:
+            shutil.copy(str(p), str(self.dir / 'extracted_examples' / p.name))
+            for ex in iter_objects(p, ['book_ID']):
+                bib = bibtex_dir / '{}.bib'.format(ex['book_ID'])
+                if bib.exists():
+                    shutil.copy(str(bib), str(self.etc_dir / 'bibtex' / bib.name))
+
+    @property
+    def cache_dir(self):
+        return self.dir / self.cache_name
+
+
+class SampleGlottolog:
+    """
+    Stands in for the Glottolog catalog in `cmd_makecldf`, serving the Glottolog data for the
+    sample from a `GlottologSnapshot`.
+    """
+    def __init__(self, path, catalog=None):
+        self.catalog = catalog
+        self.snapshot = GlottologSnapshot(path, self._api)
+
+    def _api(self):
+        if self.catalog is None:
+            raise ValueError(
+                'Glottolog data for the benchmark sample is incomplete. Pass --glottolog!')
+        return self.catalog.api
+
+    def describe(self):
+        # Signals "no Glottolog version", thus `cmd_makecldf` uses `api` rather than a snapshot of
+        # its own.
+        raise ValueError()
+
+    @property
+    def api(self):
+        return self.snapshot
+
+
+def reset_caches():
+    normalize._normalize.cache_clear()
+    clean_abbr.cache_clear()
+    cldfbench_imtvault._igt_caches.clear()
+
+
+def measure(func, setup, repeat):
+    """
+    :param func: Callable running the benchmark, returning the number of items processed.
+    :param setup: Callable called before each run of `func`.
+    :return: `dict` with number of items, throughput in items per second and peak memory in bytes.
+    """
+    best = math.inf
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        items = func()
+        best = min(best, time.perf_counter() - start)
+    # Tracing memory allocations slows down execution considerably, so we measure peak memory in a
+    # separate run.
+    setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return dict(items=items, rate=items / best, peak=peak)
+
+
+def micro_benchmarks(sample):
+    examples = [ex for p in sample for ex in iter_objects(p, EXAMPLE_FIELDS)]
+    lines = [
+        [k.replace('\\t', '__t') for k in l if k not in ['{}', '', '--']]
+        for ex in examples for l in [ex['srcwordsbare'], ex['imtwordsbare']]]
+    tokens = [k for l in lines for k in l]
+    cleaned = [[normalize(k) for k in l] for l in lines]
+    keys = [k for ex in examples for k in (ex['abbrkey'] or {})]
+    igts = []
+    for ex in examples:
+        obj, gloss = filtered(ex['srcwordsbare'], None), filtered(ex['imtwordsbare'], None)
+        if obj and gloss:
+            igts.append(dict(
+                phrase=' '.join(obj), gloss=' '.join(gloss), abbrs=get_abbrs(ex['abbrkey'])))
+
+    def run_clean():
+        c = collections.Counter()
+        for k in tokens:
+            clean(k, c)
+        return len(tokens)
+
+    def run_recombine():
+        for l in cleaned:
+            list(recombine(l))
+        return len(cleaned)
+
+    def run_clean_abbr():
+        for k in keys:
+            clean_abbr(k)
+        return len(keys)
+
+    def run_filtered():
+        c = collections.Counter()
+        for ex in examples:
+            filtered(ex['srcwordsbare'], c)
+            filtered(ex['imtwordsbare'], c)
+        return len(examples)
+
+    def run_igt():
+        for kw in igts:
+            analyze_igt(**kw)
+        return len(igts)
+
+    # Results of `clean` and `clean_abbr` are memoized, so caches are reset before each run.
+    return [
+        ('clean', 'tokens', run_clean, reset_caches),
+        ('recombine', 'lines', run_recombine, reset_caches),
+        ('clean_abbr', 'keys', run_clean_abbr, reset_caches),
+        ('filtered', 'examples', run_filtered, reset_caches),
+        ('igt', 'examples', run_igt, reset_caches),
+    ]
+
+
+def makecldf_benchmarks(args, ds, glottolog):
+    runs = itertools.count()
+
+    def makecldf():
+        ns = argparse.Namespace(log=args.log, glottolog=glottolog)
+        ns.writer = ds.cldf_writer(ns).__enter__()
+        ds.cmd_makecldf(ns)
+        # We bypass `CLDFWriter.__exit__`, because adding provenance metadata - i.e. listing the
+        # installed packages - would take up most of the time.
+        ns.writer.cldf.write(**ns.writer.objects)
+        return len(ns.writer.objects['ExampleTable'])
+
+    def cold():
+        # Each run gets a new cache directory. Note that the SQLite database of an `IGTCache` cannot
+        # simply be removed, because connections are kept open.
+        reset_caches()
+        ds.cache_name = '.cache-{}'.format(next(runs))
+
+    def warm():
+        reset_caches()
+        ds.cache_name = '.cache-warm'
+        if not ds.cache_dir.exists():
+            makecldf()
+
+    return [
+        ('makecldf (cold)', 'examples', makecldf, cold),
+        ('makecldf (warm)', 'examples', makecldf, warm),
+    ]
+
+
+def run(args):
+    sample_dir = Dataset().etc_dir / 'benchmark'
+    baseline_path = sample_dir / 'baseline.json'
+    baseline = json.loads(baseline_path.read_text(encoding='utf8')) \
+        if baseline_path.exists() else {}
+    sample = sorted(sample_dir.joinpath('examples').glob('*.json'))
+
+    env = {k: os.environ.get(k) for k in ['IMTVAULT_WORKERS', 'IMTVAULT_CACHE']}
+    # Memory is only traced in the main process, and the warm benchmark needs caching.
+    os.environ.update(IMTVAULT_WORKERS='1', IMTVAULT_CACHE='1')
+    results, regressions = {}, []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            glottolog = SampleGlottolog(sample_dir / 'glottolog.json', args.glottolog)
+            for name, unit, func, setup in \
+                    micro_benchmarks(sample) + makecldf_benchmarks(
+                        args, BenchmarkDataset(pathlib.Path(tmp), sample), glottolog):
+                args.log.info('running {}'.format(name))
+                results[name] = dict(unit=unit, **measure(func, setup, args.repeat))
+            glottolog.snapshot.write()
+    finally:
+        for k, v in env.items():
+            if v is None:
+                del os.environ[k]
+            else:
+                os.environ[k] = v
+
+    with Table(
+        args,
+        'benchmark', 'items', 'items/s', 'baseline items/s', 'change items/s',
+        'peak MiB', 'baseline peak MiB', 'change peak', 'status',
+    ) as t:
+        for name, res in results.items():
+            base = baseline.get(name)
+            row = [name, '{} {}'.format(res['items'], res['unit']), round(res['rate'])]
+            if base:
+                if base['items'] != res['items']:
+                    args.log.warning('{}: number of items differs from baseline'.format(name))
+                rate, peak = res['rate'] / base['rate'] - 1, res['peak'] / max(base['peak'], 1) - 1
+                # Differences of a few KiB in peak memory are just noise for small benchmarks.
+                ok = rate >= -args.threshold and \
+                    (peak <= args.threshold or res['peak'] - base['peak'] < 2 ** 16)
+                if not ok:
+                    regressions.append(name)
+                row.extend([
+                    round(base['rate']), '{:+.0%}'.format(rate),
+                    round(res['peak'] / 2 ** 20, 2), round(base['peak'] / 2 ** 20, 2),
+                    '{:+.0%}'.format(peak), 'ok' if ok else 'REGRESSION'])
+            else:
+                row.extend(['', '', round(res['peak'] / 2 ** 20, 2), '', '', 'no baseline'])
+            t.append(row)
+
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2), encoding='utf8')
+        return
+    if regressions:
+        args.log.error('Regressions exceeding {:.0%}: {}'.format(
+            args.threshold, ', '.join(regressions)))
+        return 1
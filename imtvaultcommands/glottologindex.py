@@ -0,0 +1,35 @@
+"""
+Build the offline Glottolog index used to resolve language names in `extractgll.py` - when run with
+`--glottolog-index` - rather than querying glottolog.org.
+"""
+import re
+import pathlib
+
+from cldfbench.cli_util import add_catalog_spec
+
+from cldfbench_imtvault import Dataset
+from glottologindex import write_index, Languoid
+
+
+def register(parser):
+    add_catalog_spec(parser, 'glottolog')
+    parser.add_argument(
+        '--output',
+        help='Path of the index file',
+        type=pathlib.Path,
+        default=Dataset().dir / 'glottologindex.txt')
+
+
+def run(args):
+    def languoids():
+        for lang in args.glottolog.api.languoids():
+            yield (
+                Languoid(lang.id, lang.level.name, lang.iso, lang.family.name if lang.family else None),
+                # Alternative names may carry a language tag, like "Yakkha [en]".
+                [lang.name] + [
+                    re.sub(r'\s*\[[a-zA-Z-]+\]$', '', n)
+                    for names in lang.names.values() for n in names])
+
+    write_index(args.output, languoids(), version=args.glottolog.describe())
+    args.log.info('Glottolog index written to {} with {:.1f} MB'.format(
+        args.output, args.output.stat().st_size / 1e6))
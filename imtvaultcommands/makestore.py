@@ -0,0 +1,24 @@
+"""
+Convert the JSON files in `extracted_examples/` into the compact column store read by
+`cldfbench makecldf`.
+"""
+import json
+
+from tqdm import tqdm
+
+from cldfbench_imtvault import Dataset
+from columnstore import write_store
+from imtvaultcache import file_digest
+
+
+def run(args):
+    ds = Dataset()
+    paths = sorted(ds.dir.joinpath('extracted_examples').glob('*.json'))
+    write_store(
+        ds.example_store_path,
+        ((p.name, file_digest(p), json.loads(p.read_text(encoding='utf8'))) for p in tqdm(paths)))
+    args.log.info('{} JSON files with {:.1f} MB written to {} with {:.1f} MB'.format(
+        len(paths),
+        sum(p.stat().st_size for p in paths) / 1e6,
+        ds.example_store_path.name,
+        ds.example_store_path.stat().st_size / 1e6))
@@ -15,6 +15,18 @@ LGRPATTERN_LOWER = re.compile(r"(%s)({})?" % "|".join([s.lower() for s in LGRLIS
 LGRPATTERN_UPPER_LOWER = re.compile(
     r"(%s)({})?" % "|".join([s[0] + s[1:].lower() for s in LGRLIST])
 )
+# \erg, \Erg etc. mapped to ERG - for the names which the LOWER and UPPER_LOWER alternations find
+# at all, i.e. which do not start with a name listed earlier (like \abl, which is matched as "a").
+LGRTABLE = {
+    v: s for s in LGRLIST for p, v in [
+        (LGRPATTERN_LOWER, s.lower()), (LGRPATTERN_UPPER_LOWER, s[0] + s[1:].lower())]
+    if p.match(v).group(1) == v
+}
+LGRPATTERN = re.compile(
+    r"\\(%s)(?![a-zA-Z])" % "|".join(sorted(LGRTABLE, key=len, reverse=True))
+)
+# strings in which LGR commands must be resolved one at a time, see `gll.resolve_lgr`
+LGRCASCADE = re.compile(r"\\\\|%s\\" % LGRPATTERN.pattern)
 #braces after a space or after the beginning of the line
 BRACESPATTERN = re.compile(r"(?<=.^| ){([^}{ ]+)}")
 GLL = re.compile(PRESOURCELINE + SOURCELINE + IMTLINE1 + IMTLINE2 + TRSLINE)
@@ -22,6 +34,11 @@ TEXTEXT = re.compile(r"\\text(.*?)\{(.*?)\}")
 TEXSTYLEENVIRONMENT = re.compile(r"\\\\textstyle[A-Z][A-Za-z].*?{(.*?)}")
 INDEXCOMMANDS = re.compile(r"\\\\i[sl]{(.*?)}")
 LABELCOMMANDS = re.compile(r"\\\\label{(.*?)}")
+SMALLCAPS = re.compile(r"\\textsc{([-\.:=<> a-zA-Z0-9]*?)}")
+PROTECTEDSPACE = re.compile(r"(?<!\\)\\ ")
+# NB: "\f" is a form feed, so this never matches a footnote - and is kept as is, because stripping
+# footnotes would change the extracted translations.
+FOOTNOTE = re.compile(r"\footnote{[^}{]*}")
 CITATION = re.compile(r"\\cite[altpv]*(\[.*?\])?\{(.*?)\}")
 
 STARTINGQUOTE = "`‘"
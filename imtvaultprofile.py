@@ -0,0 +1,126 @@
+"""
+Opt-in profiling of `cldfbench makecldf`, recording wall time, number of calls and number of items
+processed per stage of the build - e.g. BibTeX parsing, JSON loading, gloss cleaning, IGT analysis.
+
+Stages are timed with a context manager:
+
+    >>> profile = Profile()
+    >>> with profile['bibtex'] as stage:
+    ...     stage.items += 1
+
+Since the per-file stages run in worker processes, a `Profile` can be serialized with `as_dict`
+and merged into another one with `update`. A `NullProfile` supports the same API, but does not
+record anything - and evaluates to `False` - so instrumented code does not need to check whether
+profiling is enabled.
+"""
+import time
+import cProfile
+import functools
+import collections
+
+__all__ = ['Profile', 'NullProfile']
+
+
+class Stage:
+    __slots__ = ['time', 'calls', 'items', '_start']
+
+    def __init__(self, time=0.0, calls=0, items=0):
+        self.time, self.calls, self.items = time, calls, items
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.time += time.perf_counter() - self._start
+        self.calls += 1
+
+
+class Profile:
+    def __init__(self, cprofile=False):
+        """
+        :param cprofile: Flag signaling whether to provide a `cProfile.Profile` as `cprofile`, to \
+        profile selected parts of the code in detail.
+        """
+        self.stages = {}
+        self.counts = collections.Counter()
+        self.cprofile = cProfile.Profile() if cprofile else None
+
+    def __getitem__(self, name):
+        if name not in self.stages:
+            self.stages[name] = Stage()
+        return self.stages[name]
+
+    def iter(self, name, items):
+        """
+        Time the retrieval of items from an iterable, e.g. decoding JSON objects from a file.
+        """
+        stage, items = self[name], iter(items)
+        while True:
+            with stage:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            stage.items += 1
+            yield item
+
+    def timed(self, name, func):
+        """
+        :return: Wrapper of callable `func`, timing each call.
+        """
+        @functools.wraps(func)
+        def wrapped(*args, **kw):
+            with self[name]:
+                return func(*args, **kw)
+        return wrapped
+
+    def as_dict(self):
+        return dict(
+            stages={
+                name: dict(time=s.time, calls=s.calls, items=s.items)
+                for name, s in self.stages.items()},
+            counts=dict(self.counts))
+
+    def update(self, d):
+        for name, s in d['stages'].items():
+            stage = self[name]
+            stage.time += s['time']
+            stage.calls += s['calls']
+            stage.items += s['items']
+        self.counts.update(d['counts'])
+
+    def report(self, **kw):
+        """
+        :param kw: Additional data to include in the report.
+        :return: `dict` suitable for JSON serialization.
+        """
+        res = self.as_dict()
+        for s in res['stages'].values():
+            s['items_per_second'] = s['items'] / s['time'] if s['time'] and s['items'] else None
+        res.update(kw)
+        return res
+
+
+class _NullStage(Stage):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class NullProfile(Profile):
+    _stage = _NullStage()
+
+    def __bool__(self):
+        return False
+
+    def __getitem__(self, name):
+        return self._stage
+
+    def iter(self, name, items):
+        return items
+
+    def timed(self, name, func):
+        return func
@@ -1,12 +1,21 @@
+import re
 import json
 import glob
 import pprint
 import os
 
+from jsonstream import iter_objects
 
-basefiles = glob.glob("langscijson/*json")
+# The output of extractgll.py, in any of its formats:
+basefiles = [
+    f for f in glob.glob("langscijson/*") if f.endswith((".json", ".jsonl", ".jsonl.gz"))]
 
 ld = False
+# Render the HTML of examples extracted without it (see `extractgll.py --html`). Switching this off
+# drops the `html` field from the output, unless it was created on extraction.
+html = True
+if html:
+    from extractgll import render_html
 
 context = {}
 if ld:
@@ -55,10 +64,9 @@ except FileExistsError:
     pass
 
 for filename in basefiles:
-    closurefilename = filename.replace("langscijson", "closurejson")
-    outfilename = filename.replace("langscijson", "fulljson")
-    with open(filename) as base:
-        based = json.loads(base.read())
+    jsonfilename = re.sub(r"\.jsonl(\.gz)?$", ".json", filename)
+    closurefilename = jsonfilename.replace("langscijson", "closurejson")
+    outfilename = jsonfilename.replace("langscijson", "fulljson")
     try:
         with open(closurefilename) as closure:
             closured = json.loads(closure.read())
@@ -66,7 +74,7 @@ for filename in basefiles:
         print(f"{closurefilename} not found")
         continue
     outd = {}
-    for ex in based:
+    for ex in iter_objects(filename):
         imtlg = "en-x-lgr"
         if ex["book_metalanguage"] == "fra":
             imtlg = "fr-x-lgr"
@@ -97,6 +105,8 @@ for filename in basefiles:
         srcstring = " ".join(ex["srcwordsbare"])
         imtstring = " ".join(ex["imtwordsbare"])
         ex["label"] = srcstring
+        if html and "html" not in ex:
+            ex["html"] = render_html(ex["srcwordstex"], ex["imtwordstex"])
         if ld:
             ex["@id"] = ID + "_u"
             ex["topic"] = [
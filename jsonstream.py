@@ -0,0 +1,144 @@
+"""
+Incremental reading of JSON files containing a list of objects, e.g. the files in
+`extracted_examples/`.
+
+`json.load` materializes the complete list - including big, unused values like the `html` of each
+example. `iter_objects` decodes one list item at a time from a buffered file, so memory use is
+bounded by the size of the largest item rather than by the size of the file.
+
+Objects can also be stored in JSON Lines files - optionally gzip compressed - written one at a time
+with a `JSONLinesWriter`, e.g. by `extractgll.py --format jsonl`. `iter_objects` reads these
+line by line.
+"""
+import io
+import json
+import gzip
+
+__all__ = ['iter_objects', 'is_jsonlines', 'JSONLinesWriter']
+
+WHITESPACE = ' \t\n\r'
+
+
+class _Buffer:
+    def __init__(self, f, chunksize):
+        self.f, self.chunksize = f, chunksize
+        self.text, self.pos, self.eof = '', 0, False
+
+    def fill(self):
+        chunk = self.f.read(self.chunksize)
+        if not chunk:
+            self.eof = True
+        # Discard what has been consumed already, to keep the buffer small.
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return bool(chunk)
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text) or not self.fill():
+                return
+
+    def next_char(self):
+        self.skip_whitespace()
+        if self.pos >= len(self.text):
+            raise ValueError('Unexpected end of JSON input in {}'.format(self.f.name))
+        return self.text[self.pos]
+
+
+def is_jsonlines(p):
+    return str(p).endswith(('.jsonl', '.jsonl.gz'))
+
+
+class JSONLinesWriter:
+    """
+    Write objects to a JSON Lines file, one compact line per object.
+
+    Use as context manager:
+
+        with JSONLinesWriter(p) as writer:
+            writer.write(obj)
+    """
+    def __init__(self, p, compress=None):
+        """
+        :param compress: Flag signaling whether to gzip the output - by default if `p` ends with \
+        `.gz`.
+        """
+        self.path = p
+        self.compress = str(p).endswith('.gz') if compress is None else compress
+        self.f, self.raw, self.count = None, None, 0
+
+    def __enter__(self):
+        if self.compress:
+            # Omit name and timestamp from the gzip header, to make the output reproducible.
+            self.raw = open(str(self.path), 'wb')
+            self.f = io.TextIOWrapper(
+                gzip.GzipFile(fileobj=self.raw, mode='wb', filename='', mtime=0), encoding='utf8')
+        else:
+            self.f = open(str(self.path), 'w', encoding='utf8')
+        return self
+
+    def __exit__(self, *args):
+        self.f.close()
+        if self.raw:  # GzipFile does not close a file object passed in.
+            self.raw.close()
+
+    def write(self, obj):
+        self.f.write(json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(',', ':')))
+        self.f.write('\n')
+        self.count += 1
+
+
+def _iter_lines(p, keys):
+    opener = gzip.open if str(p).endswith('.gz') else open
+    with opener(str(p), 'rt', encoding='utf8') as f:
+        for line in f:
+            if line.strip():
+                obj = json.loads(line)
+                if keys is not None and isinstance(obj, dict):
+                    obj = {k: v for k, v in obj.items() if k in keys}
+                yield obj
+
+
+def iter_objects(p, keys=None, chunksize=2 ** 16):
+    """
+    :param p: Path of a JSON file containing a list - or of a JSON Lines file, see `is_jsonlines`.
+    :param keys: If not `None`, an iterable of keys - the dicts in the list are projected onto \
+    these keys, i.e. all other keys are dropped right after decoding an item.
+    :return: Generator of the list items.
+    """
+    keys = set(keys) if keys is not None else None
+    if is_jsonlines(p):
+        yield from _iter_lines(p, keys)
+        return
+    decoder = json.JSONDecoder()
+    with open(str(p), encoding='utf8') as f:
+        buf = _Buffer(f, chunksize)
+        if buf.next_char() != '[':
+            raise ValueError('{} does not contain a JSON list'.format(p))
+        buf.pos += 1
+        if buf.next_char() == ']':
+            return
+        while True:
+            buf.next_char()
+            while True:
+                try:
+                    obj, end = decoder.raw_decode(buf.text, buf.pos)
+                    # A value at the very end of the buffer (e.g. a number) may be truncated.
+                    if end < len(buf.text) or buf.eof:
+                        break
+                except json.JSONDecodeError:
+                    if buf.eof:
+                        raise
+                buf.fill()
+            buf.pos = end
+            if keys is not None and isinstance(obj, dict):
+                obj = {k: v for k, v in obj.items() if k in keys}
+            yield obj
+            c = buf.next_char()
+            buf.pos += 1
+            if c == ']':
+                return
+            if c != ',':
+                raise ValueError('Expected "," or "]" in {}, found {}'.format(p, c))
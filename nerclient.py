@@ -0,0 +1,187 @@
+"""
+A client for the `disambiguate` endpoint of the entity-fishing NER service, running many requests
+concurrently.
+
+Requests are coordinated with `asyncio`: at most `concurrency` requests are in flight, and - if a
+`rate` is given - requests are started at no more than `rate` per second, as controlled by a token
+bucket. The HTTP requests themselves are made with a `requests.Session` - i.e. re-using pooled
+connections - in a thread pool, so no async HTTP library is required.
+
+Failed requests - connection errors, timeouts and responses with status 429 or 5xx - are retried
+with exponential backoff, honoring a `Retry-After` header. Results are returned in input order,
+no matter in which order the responses arrive.
+
+Since entity-fishing refuses short texts, and most texts we annotate are short, many texts can be
+packed into one document - separated by `SENTINEL` - with `pack`. The entities found in the
+document are mapped back to the texts with `unpack`, based on their character offsets.
+
+To run against a local stub server, pass its URL:
+
+    python addNER.py --ner-url http://localhost:8080/disambiguate
+"""
+import time
+import random
+import bisect
+import asyncio
+import concurrent.futures
+
+import requests
+from requests.adapters import HTTPAdapter
+
+__all__ = ['NER_URL', 'SENTINEL', 'TokenBucket', 'NERClient', 'pack', 'unpack']
+
+NER_URL = "https://cloud.science-miner.com/nerd/service/disambiguate"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Separates packed texts: A paragraph of its own, so that no sentence spans two texts.
+SENTINEL = "\n\n###\n\n"
+
+
+def pack(texts, size=5000):
+    """
+    Pack texts into documents of at most `size` characters - unless a single text is longer.
+
+    :return: `list` of pairs `(document, offsets)`, with `offsets` the start offsets of the texts \
+    in the document; the texts of all documents are in the order of `texts`.
+    """
+    res, document, offsets = [], '', []
+    for text in texts:
+        if offsets and len(document) + len(SENTINEL) + len(text) > size:
+            res.append((document, offsets))
+            document, offsets = '', []
+        if offsets:
+            document += SENTINEL
+        offsets.append(len(document))
+        document += text
+    if offsets:
+        res.append((document, offsets))
+    return res
+
+
+def unpack(entities, offsets, lengths):
+    """
+    Map entities found in a document created by `pack` back to the packed texts.
+
+    :param entities: The entities returned for the document, with `offsetStart` and `offsetEnd`.
+    :param lengths: The lengths of the packed texts.
+    :return: `list` with the `list` of entities for each packed text - with offsets relative to \
+    the text. Entities without offsets, or extending beyond a text, are dropped.
+    """
+    res = [[] for _ in offsets]
+    for entity in entities:
+        start, end = entity.get('offsetStart'), entity.get('offsetEnd')
+        if start is None or end is None:
+            continue
+        i = bisect.bisect_right(offsets, start) - 1
+        if i >= 0 and end <= offsets[i] + lengths[i]:
+            res[i].append(dict(entity, offsetStart=start - offsets[i], offsetEnd=end - offsets[i]))
+    return res
+
+
+class TokenBucket:
+    """
+    Rate limit: `acquire` returns as soon as a token is available. Tokens are added at `rate` per
+    second, up to `capacity`.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate, self.capacity = rate, capacity
+        self.tokens, self.updated = capacity, time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class NERClient:
+    def __init__(
+            self,
+            url=NER_URL,
+            concurrency=8,
+            rate=None,
+            retries=5,
+            backoff=1.0,
+            timeout=120):
+        """
+        :param concurrency: Maximal number of requests in flight.
+        :param rate: Maximal number of requests started per second, or `None`.
+        :param retries: Number of retries of a failed request, before the error is raised.
+        :param backoff: Seconds to wait before the first retry; doubled for each further retry.
+        """
+        self.url, self.concurrency, self.rate = url, concurrency, rate
+        self.retries, self.backoff, self.timeout = retries, backoff, timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.requests, self.retried = 0, 0
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _post(self, text):
+        """
+        :return: Pair `(response, exception)`.
+        """
+        try:
+            return self.session.post(self.url, json={"text": text}, timeout=self.timeout), None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            return None, e
+
+    def _delay(self, attempt, response):
+        try:
+            return float(response.headers['Retry-After'])
+        except (AttributeError, KeyError, ValueError):
+            # Jitter keeps retries of concurrent requests from arriving all at once.
+            return self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+
+    async def _disambiguate(self, loop, executor, semaphore, bucket, text):
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                if bucket:
+                    await bucket.acquire()
+                self.requests += 1
+                response, error = await loop.run_in_executor(executor, self._post, text)
+                if error is None and response.status_code not in RETRY_STATUS:
+                    return response.text
+                if attempt == self.retries:
+                    if error is not None:
+                        raise error
+                    response.raise_for_status()
+                self.retried += 1
+                await asyncio.sleep(self._delay(attempt, response))
+
+    async def disambiguate_all(self, texts):
+        """
+        :return: `list` of the response texts for `texts`, in the same order.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        bucket = TokenBucket(self.rate) if self.rate else None
+        with concurrent.futures.ThreadPoolExecutor(self.concurrency) as executor:
+            tasks = [
+                asyncio.ensure_future(self._disambiguate(loop, executor, semaphore, bucket, text))
+                for text in texts]
+            try:
+                return await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    def __call__(self, texts):
+        """
+        Synchronous interface: Run `disambiguate_all` for `texts`.
+        """
+        return asyncio.run(self.disambiguate_all(list(texts)))
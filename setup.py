@@ -3,7 +3,17 @@ from setuptools import setup
 
 setup(
     name='cldfbench_imtvault',
-    py_modules=['cldfbench_imtvault'],
+    py_modules=[
+        'cldfbench_imtvault',
+        'trieregex',
+        'jsonstream',
+        'imtvaultcache',
+        'imtvaultprofile',
+        'columnstore',
+        'glottologindex',
+        'nerclient',
+        'gazetteer',
+    ],
     include_package_data=True,
     zip_safe=False,
     entry_points={
@@ -0,0 +1,244 @@
+"""
+Compiled rewriting of LaTeX markup, as done by `extractgll.gll.striptex` for each word and
+translation.
+
+A `Rewriter` applies a table of string replacements - like `imtvaultconstants.TEXREPLACEMENTS`.
+
+Applying the table as a chain of `str.replace` calls means scanning each string once per rule. A
+`Rewriter` only considers the rules which can possibly match:
+
+- In `ordered` mode, results are exactly those of the chain of `str.replace` calls, i.e. each rule
+  is applied to the result of the previous ones. But since all patterns contain a backslash, a rule
+  can only match if the string contains the backslash (and the character following it) of the
+  pattern. So strings without backslash are returned right away, and for all others, only rules
+  for the backslash sequences actually present are tried.
+- In `longest` mode, the table is compiled into a single regular expression, and all matches are
+  replaced in one pass over the string, preferring the longest pattern at each position. Since
+  replacements are not re-scanned, results differ from `ordered` mode where the output of a rule is
+  input to a later one.
+
+An `ArgumentYanker` removes LaTeX commands - like `imtvaultconstants.TEXTARGYANKS` - together with
+their argument, in one scan of the string. Arguments are matched brace-balanced, i.e. `\\is{a{b}c}`
+is removed completely.
+
+Running this module as script checks both modes of `Rewriter` against the chain of `str.replace`
+calls on the whitespace separated words and the lines of the given files:
+
+    python texrewriter.py raw/raw_texfiles/raw/*/*.tex
+
+With `--benchmark`, the per-word time of the compiled rewriting is compared with the chain of
+`str.replace` calls and the one-regex-per-command removal of arguments.
+"""
+import re
+import sys
+import math
+import time
+import bisect
+import argparse
+import functools
+
+from trieregex import trie_regex
+
+__all__ = ['Rewriter', 'ArgumentYanker']
+
+
+def chained(rules, s):
+    """
+    The reference implementation.
+    """
+    for r in rules:
+        s = s.replace(*r)
+    return s
+
+
+class Rewriter:
+    def __init__(self, rules, mode='ordered'):
+        """
+        :param rules: Ordered list of `(pattern, replacement)` pairs. All patterns must contain a \
+        backslash.
+        :param mode: `ordered` or `longest`.
+        """
+        assert mode in ('ordered', 'longest')
+        assert all('\\' in pattern for pattern, _ in rules)
+        self.rules, self.mode = list(rules), mode
+        if mode == 'ordered':
+            # Map the backslash sequence - i.e. the first backslash and the character following it -
+            # of each pattern to the indices of the rules:
+            self.index = {}
+            for i, (pattern, _) in enumerate(self.rules):
+                self.index.setdefault(self._key(pattern), []).append(i)
+            self._candidates = functools.lru_cache(maxsize=2 ** 12)(self._candidates)
+        else:
+            table = {}
+            for pattern, replacement in self.rules:
+                table.setdefault(pattern, replacement)  # Only the first rule for a pattern matches.
+            self.regex = re.compile(trie_regex(table))
+            self.table = table
+
+    @staticmethod
+    def _key(s, i=None):
+        i = s.index('\\') if i is None else i
+        return s[i:i + 2]
+
+    @classmethod
+    def keys(cls, s):
+        """
+        :return: The backslash sequences in `s` - including the bare backslash, which is the key \
+        of patterns ending with their first backslash.
+        """
+        res, i = {'\\'}, s.find('\\')
+        while i != -1:
+            res.add(cls._key(s, i))
+            i = s.find('\\', i + 1)
+        return frozenset(res)
+
+    def _candidates(self, keys):
+        return sorted(i for key in keys for i in self.index.get(key, []))
+
+    def __call__(self, s):
+        if '\\' not in s:
+            return s
+        if self.mode == 'longest':
+            return self.regex.sub(lambda m: self.table[m.group()], s)
+        start = 0
+        while '\\' in s:
+            # Rules which can match the current string, in order:
+            candidates = self._candidates(self.keys(s))
+            for i in candidates[bisect.bisect_left(candidates, start):]:
+                pattern, replacement = self.rules[i]
+                if pattern in s:
+                    s, start = s.replace(pattern, replacement), i + 1
+                    # The replacement may have added or removed backslash sequences.
+                    break
+            else:
+                break
+        return s
+
+
+class ArgumentYanker:
+    _brace = re.compile(r'\\.|[{}]')
+
+    def __init__(self, commands):
+        """
+        :param commands: List of command names, as regex patterns - e.g. `vspace\\*`.
+        """
+        self.regex = re.compile(r'\\(?:{})\{{'.format('|'.join(commands)))
+
+    def _end(self, s, i):
+        """
+        :return: Index after the brace closing the argument starting at `i`.
+        """
+        depth = 1
+        for m in self._brace.finditer(s, i):
+            if m.group() == '{':
+                depth += 1
+            elif m.group() == '}':
+                depth -= 1
+                if depth == 0:
+                    return m.end()
+        # Unbalanced braces - e.g. in a word split off an argument containing whitespace. Like a
+        # non-greedy `{.*?}`, we remove up to the next closing brace, if any.
+        end = s.find('}', i)
+        return end + 1 if end != -1 else None
+
+    def __call__(self, s):
+        m = self.regex.search(s) if '\\' in s else None
+        if not m:
+            return s
+        chunks, pos = [], 0
+        while m:
+            end = self._end(s, m.end())
+            if end is None:
+                chunks.append(s[pos:m.end()])
+                pos = m.end()
+            else:
+                chunks.append(s[pos:m.start()])
+                pos = end
+            m = self.regex.search(s, pos)
+        chunks.append(s[pos:])
+        return ''.join(chunks)
+
+
+def yanked(commands, s):
+    """
+    The one-regex-per-command implementation, matching arguments non-greedily.
+    """
+    for r in commands:
+        s = re.sub(r"\\%s{.*?}" % r, "", s)
+    return s
+
+
+def check(rules, strings):
+    """
+    :return: `dict` mapping mode to list of `(string, expected, result)` triples for mismatches.
+    """
+    rewriters = {mode: Rewriter(rules, mode) for mode in ['ordered', 'longest']}
+    res = {mode: [] for mode in rewriters}
+    for s in strings:
+        expected = chained(rules, s)
+        for mode, rewriter in rewriters.items():
+            if rewriter(s) != expected:
+                res[mode].append((s, expected, rewriter(s)))
+    return res
+
+
+def benchmark(strings, repeat=5):
+    """
+    :return: `list` of `(name, reference time, compiled time)` triples, with times per string.
+    """
+    from imtvaultconstants import TEXREPLACEMENTS, TEXTARGYANKS
+
+    rewriter, yanker = Rewriter(TEXREPLACEMENTS), ArgumentYanker(TEXTARGYANKS)
+
+    def best(func):
+        res = math.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for s in strings:
+                func(s)
+            res = min(res, time.perf_counter() - start)
+        return res / len(strings)
+
+    return [
+        ('TEXREPLACEMENTS', best(lambda s: chained(TEXREPLACEMENTS, s)), best(rewriter)),
+        ('TEXTARGYANKS', best(lambda s: yanked(TEXTARGYANKS, s)), best(yanker)),
+    ]
+
+
+def main(args=None):  # pragma: no cover
+    from imtvaultconstants import TEXREPLACEMENTS
+
+    parser = argparse.ArgumentParser(description='Check Rewriter against chained str.replace.')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument(
+        '--benchmark',
+        help='Compare time per word of compiled and reference implementations',
+        action='store_true',
+        default=False)
+    args = parser.parse_args(args)
+    strings = set()
+    for fname in args.files:
+        with open(fname, encoding='utf8') as f:
+            for line in f:
+                strings.add(line)
+                strings.update(line.split())
+    strings = sorted(strings)
+    if args.benchmark:
+        words = [s for s in strings if '\n' not in s]
+        print('{} distinct words'.format(len(words)))
+        for name, reference, compiled in benchmark(words):
+            print('{}: {:.2f}µs -> {:.2f}µs per word ({:.1f}x)'.format(
+                name, reference * 1e6, compiled * 1e6, reference / compiled))
+        return 0
+    res = check(TEXREPLACEMENTS, strings)
+    print('{} distinct strings, {} with backslash'.format(
+        len(strings), sum(1 for s in strings if '\\' in s)))
+    for mode, mismatches in res.items():
+        print('{}: {} mismatches'.format(mode, len(mismatches)))
+        for s, expected, result in mismatches[:10]:
+            print('  {!r}\n    expected: {!r}\n    got:      {!r}'.format(s, expected, result))
+    return 1 if res['ordered'] else 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Compile a list of words into a regular expression alternation with shared prefixes factored out.
+
+A plain alternation like `ABL|ABS|ACC|...` makes the regex engine try every alternative at every
+position. Turning the words into a trie first yields a pattern like `A(?:B[LS]|CC)|...`, where each
+character is tested at most once per trie level.
+"""
+import re
+
+__all__ = ['trie_regex']
+
+
+def _trie(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for c in word:
+            node = node.setdefault(c, {})
+        node[''] = None
+    return trie
+
+
+def _pattern(node):
+    if list(node) == ['']:  # A leaf.
+        return ''
+    alternatives, chars = [], []
+    for c in sorted(k for k in node if k):
+        sub = _pattern(node[c])
+        if sub:
+            alternatives.append(re.escape(c) + sub)
+        else:
+            chars.append(re.escape(c))
+    if chars:
+        alternatives.append(chars[0] if len(chars) == 1 else '[{}]'.format(''.join(chars)))
+    if len(alternatives) > 1:
+        res = '(?:{})'.format('|'.join(alternatives))
+    else:
+        res = alternatives[0]
+        if '' in node and not chars:
+            res = '(?:{})'.format(res)  # A sequence must be grouped before making it optional.
+    if '' in node:
+        # The word ending here is a prefix of other words: Try the longer ones first.
+        res += '?'
+    return res
+
+
+def trie_regex(words):
+    """
+    :param words: Iterable of non-empty strings.
+    :return: `str` regex pattern (without enclosing group), matching exactly the words.
+    """
+    words = set(words)
+    assert words and all(words), 'trie_regex needs a non-empty list of non-empty words'
+    return _pattern(_trie(words))